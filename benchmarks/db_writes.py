@@ -0,0 +1,81 @@
+"""
+Compares the sqlite write paths of `BikeModel`.
+
+The commit per row path is timed on `--row-by-row` rows only as it is very
+slow, its rows/sec is used to estimate the time for all the rows.
+
+> python -m benchmarks.db_writes --rows 1000000
+"""
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from src.database.db import DB
+from src.database.models import BikeModel
+
+
+def make_rows(size):
+    return [{
+        'model_name': f'Bajaj Avenger Cruise 220 {2000 + i % 20}',
+        'model_year': str(2000 + i % 20),
+        'kms_driven': f'{i % 90000} Km',
+        'owner': 'first owner',
+        'location': 'hyderabad',
+        'mileage': '35 kmpl',
+        'power': '19 bhp',
+        'price': str(20000 + i % 100000),
+    } for i in range(size)]
+
+
+def save_each(model, rows):
+    for row in rows:
+        model.save(row)
+
+    model.flush()
+
+
+def save_many(model, rows):
+    model.save_many(rows)
+
+
+@click.command()
+@click.option('--rows', default=1_000_000, help='Number of rows to insert.')
+@click.option('--row-by-row', default=10_000,
+              help='Rows inserted by the commit per row path.')
+def main(rows, row_by_row):
+    data = make_rows(rows)
+
+    cases = [
+        ('commit per row', {}, save_each, data[:row_by_row]),
+        ('batch 1000', {'batch_size': 1000}, save_each, data),
+        ('batch 1000 + WAL', {
+            'batch_size': 1000, 'journal_mode': 'WAL',
+            'synchronous': 'NORMAL', 'cache_size': -64000}, save_each, data),
+        ('save_many', {}, save_many, data),
+        ('save_many + WAL', {
+            'journal_mode': 'WAL', 'synchronous': 'NORMAL',
+            'cache_size': -64000}, save_many, data),
+    ]
+
+    print(f"{'path':>18} {'rows':>9} {'time (s)':>9} {'rows/sec':>10} "
+          f"{f'est. {rows} rows (s)':>20}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, (name, options, save, case_rows) in enumerate(cases):
+            DB.DB_NAME = str(Path(tmp_dir) / f'{i}.db')
+
+            with BikeModel(**options) as model:
+                start = time.perf_counter()
+                save(model, case_rows)
+                elapsed = time.perf_counter() - start
+
+            rate = len(case_rows) / elapsed
+
+            print(f'{name:>18} {len(case_rows):>9} {elapsed:>9.2f} '
+                  f'{rate:>10.0f} {rows / rate:>20.1f}')
+
+
+if __name__ == '__main__':
+    main()
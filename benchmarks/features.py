@@ -0,0 +1,56 @@
+"""
+Compares the row-wise & vectorized paths of `FeatureBuilder`.
+
+The processed dataset has to exist, it is saved by
+`python -m src.models.train_model`. Then from the project root,
+
+> python -m benchmarks.features --sizes 100000,1000000,5000000
+"""
+import time
+
+import click
+import pandas as pd
+
+from src.features.build_features import FeatureBuilder
+
+
+def time_features(df: pd.DataFrame, vectorized: bool):
+    builder = FeatureBuilder(vectorized=vectorized)
+    builder.df = df.copy()
+
+    # make_features fits the vocabulary the row-wise path never uses, fit
+    # it before the clock starts so only the vectorized path pays for it
+    if not vectorized:
+        builder.fit(builder.df)
+
+    start = time.perf_counter()
+    features = builder.make_features()
+
+    return time.perf_counter() - start, features
+
+
+@click.command()
+@click.option('--sizes', default='100000,1000000,5000000',
+              help='Comma separated row counts to benchmark.')
+def main(sizes):
+    data = FeatureBuilder().load_data()
+
+    print(f"{'rows':>12} {'row-wise (s)':>14} {'vectorized (s)':>16} "
+          f"{'speedup':>9}")
+
+    for size in [int(s) for s in sizes.split(',')]:
+        df = data.sample(size, replace=True, random_state=42) \
+            .reset_index(drop=True)
+
+        slow, expected = time_features(df, vectorized=False)
+        fast, actual = time_features(df, vectorized=True)
+
+        # same values, the vectorized path gives categoricals & float columns
+        pd.testing.assert_frame_equal(
+            expected, actual, check_dtype=False, check_categorical=False)
+
+        print(f'{size:>12} {slow:>14.2f} {fast:>16.2f} {slow / fast:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
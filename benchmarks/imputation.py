@@ -0,0 +1,74 @@
+"""
+Compares the imputation strategies of `FrameImputer`: the fit & transform
+time on resampled features & the test scores of the models trained with
+each of them on the real features.
+
+The processed dataset has to exist, it is saved by
+`python -m src.models.train_model`. Then from the project root,
+
+> python -m benchmarks.imputation --sizes 10000,50000,100000
+"""
+import time
+
+import click
+import pandas as pd
+
+from src.features.build_features import FeatureBuilder
+from src.features.outliers import Outliers
+from src.models.imputation import FrameImputer
+from src.models.model_factory import ModelFactory
+
+
+def time_imputer(X, strategy):
+    start = time.perf_counter()
+    FrameImputer(strategy).fit(X).transform(X)
+    return time.perf_counter() - start
+
+
+def test_scores(df, strategy, model_names):
+    scores = {}
+
+    for name in model_names:
+        model = ModelFactory().get_model(name)(df)
+        model.imputer = strategy
+        model.cross_validate = False
+
+        _, test_result = model.train()
+        scores[name] = test_result['R^2'][0]
+
+    return scores
+
+
+@click.command()
+@click.option('--sizes', default='10000,50000,100000',
+              help='Comma separated row counts for the timings.')
+@click.option('--models', default='linear_regression,gradient_boost',
+              help='Comma separated models used to compare the scores.')
+def main(sizes, models):
+    features = Outliers(FeatureBuilder().build()).detect()
+    X = features.drop(columns='price')
+
+    print(f"{'rows':>10} " + ' '.join(
+        f'{strategy + " (s)":>18}' for strategy in FrameImputer.STRATEGIES))
+
+    for size in [int(s) for s in sizes.split(',')]:
+        sample = X.sample(size, replace=True, random_state=42) \
+            .reset_index(drop=True)
+
+        times = [time_imputer(sample, strategy)
+                 for strategy in FrameImputer.STRATEGIES]
+
+        print(f'{size:>10} ' + ' '.join(f'{t:>18.2f}' for t in times))
+
+    model_names = models.split(',')
+    scores = pd.DataFrame({
+        strategy: test_scores(features, strategy, model_names)
+        for strategy in FrameImputer.STRATEGIES
+    })
+
+    print('\ntest R^2')
+    print(scores.round(4).to_string())
+
+
+if __name__ == '__main__':
+    main()
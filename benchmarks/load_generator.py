@@ -0,0 +1,120 @@
+"""
+Sends concurrent single listing requests to the prediction service.
+
+Start the service first with `python -m src.models.serve_model`, then
+
+> python -m benchmarks.load_generator --concurrency 32 --requests 20000
+"""
+from http.client import HTTPConnection
+from urllib.parse import urlparse
+import json
+import threading
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from src.data.preprocessing import Preprocessor
+
+
+def load_listings(size):
+    raw = pd.read_csv(str(Preprocessor.data_file)).drop(columns=['price'])
+    raw = raw.sample(size, replace=True, random_state=42)
+
+    # NaN is not valid JSON
+    return [json.dumps({k: v for k, v in row.items() if v == v})
+            for row in raw.to_dict('records')]
+
+
+def check_keep_alive(url, body):
+    """
+    Sends requests the service rejects before a valid one on the same
+    connection, the valid one fails if a rejected body was left unread.
+    """
+    conn = HTTPConnection(url.hostname, url.port)
+    headers = {'Content-Type': 'application/json'}
+
+    for path, expected in [('/missing', 404),
+                           ('/predict?model=missing-model', 404),
+                           ('/predict', 200)]:
+        conn.request('POST', path, body, headers)
+        response = conn.getresponse()
+        response.read()
+
+        if response.status != expected:
+            raise click.ClickException(
+                f'POST {path} after rejected requests on the same '
+                f'connection returned {response.status}, expected {expected}')
+
+    conn.close()
+
+
+def worker(url, bodies, latencies, errors):
+    conn = HTTPConnection(url.hostname, url.port)
+    path = url.path + (f'?{url.query}' if url.query else '')
+
+    for body in bodies:
+        start = time.perf_counter()
+
+        try:
+            conn.request('POST', path, body,
+                         {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+
+            if response.status != 200:
+                errors.append(response.status)
+        except OSError as e:
+            errors.append(str(e))
+            conn.close()
+            conn = HTTPConnection(url.hostname, url.port)
+
+        latencies.append(time.perf_counter() - start)
+
+    conn.close()
+
+
+@click.command()
+@click.option('--url', default='http://127.0.0.1:8000/predict',
+              help='Prediction endpoint, add ?model=<name> to pick a model.')
+@click.option('--concurrency', default=32, help='Number of parallel clients.')
+@click.option('--requests', 'total', default=10_000,
+              help='Total number of requests to send.')
+def main(url, concurrency, total):
+    url = urlparse(url)
+    bodies = load_listings(total)
+
+    check_keep_alive(url, bodies[0])
+
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=worker, args=(
+            url, bodies[i::concurrency], latencies, errors))
+        for i in range(concurrency)
+    ]
+
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+
+    print(f'requests     : {len(latencies)} ({len(errors)} errors)')
+    print(f'concurrency  : {concurrency}')
+    print(f'requests/sec : {len(latencies) / elapsed:.0f}')
+    print(f'latency (ms) : p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f}')
+
+    conn = HTTPConnection(url.hostname, url.port)
+    conn.request('GET', '/metrics')
+    print('server metrics :',
+          json.dumps(json.loads(conn.getresponse().read()), indent=2))
+
+
+if __name__ == '__main__':
+    main()
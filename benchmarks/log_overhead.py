@@ -0,0 +1,134 @@
+"""
+Measures what logging costs the code doing it, with the old synchronous
+handlers & with the queue backend of `Logger`.
+
+    sync          handler writing on the thread logging, f-string message
+    queue         `Logger`, message args formatted by the background thread
+    rate limited  `Logger` with `rate_limit`, like the scraper
+    debug off     debug messages below the level, f-string vs lazy args
+
+Every case logs `--messages` lines in a loop doing `--work-us` of other work
+per line, like the scraper handling a listing. The loop time is compared to
+the same loop without logging. `--io-latency-us` makes every write of the
+handlers that slow, like a console or a busy disk; the queue backend does
+those writes on its own thread.
+
+> python -m benchmarks.log_overhead --messages 100000 --io-latency-us 50
+"""
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from src.utils import logger as log_backend
+from src.utils.logger import LOG_DATE_FORMAT, LOG_FORMAT, Logger
+
+
+class SlowStream:
+    """File whose writes take at least `latency_us`."""
+
+    def __init__(self, path, latency_us):
+        self.f = open(path, 'a')
+        self.latency = latency_us / 1e6
+
+    def write(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+
+        self.f.write(text)
+
+    def flush(self):
+        self.f.flush()
+
+
+def work(us):
+    """Busy loop standing in for the work done per logged line."""
+    end = time.perf_counter() + us / 1e6
+
+    while time.perf_counter() < end:
+        pass
+
+
+def run(log, messages, work_us):
+    start = time.perf_counter()
+
+    for i in range(messages):
+        work(work_us)
+        log(i)
+
+    return time.perf_counter() - start
+
+
+def sync_logger(log_file, latency_us):
+    handler = logging.StreamHandler(SlowStream(log_file, latency_us))
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    logger = logging.getLogger('benchmarks.log_overhead.sync')
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+    return logger
+
+
+@click.command()
+@click.option('--messages', default=100_000)
+@click.option('--work-us', default=20.0,
+              help='Microseconds of other work per logged line.')
+@click.option('--io-latency-us', default=0.0,
+              help='Microseconds each write of a log line takes.')
+def main(messages, work_us, io_latency_us):
+    model = 'Royal Enfield Classic 350cc 2019'
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sync = sync_logger(Path(tmp_dir) / 'sync.log', io_latency_us)
+
+        queued = Logger('benchmarks.log_overhead.queue',
+                        log_file=str(Path(tmp_dir) / 'queue.log'))
+
+        # same slow writes for the handler of the background thread
+        for handler in log_backend._backend.handlers:
+            handler.setStream(
+                SlowStream(Path(tmp_dir) / 'queue.log', io_latency_us))
+
+        limited = Logger('benchmarks.log_overhead.limited', rate_limit=20)
+        gated = Logger('benchmarks.log_overhead.gated')
+        gated._logger.setLevel(logging.INFO)
+
+        cases = {
+            'no logging': lambda i: None,
+            'sync': lambda i: sync.info(
+                f'Saving data of {model} #{i} to database...'),
+            'queue': lambda i: queued.info(
+                'Saving data of %s #%s to database...', model, i),
+            'rate limited': lambda i: limited.info(
+                'Saving data of %s #%s to database...', model, i),
+            'debug off, f-string': lambda i: gated.debug(
+                f'Saving data of {model} #{i} to database...'),
+            'debug off, lazy': lambda i: gated.debug(
+                'Saving data of %s #%s to database...', model, i),
+        }
+
+        baseline = None
+
+        print(f"{'case':>20} {'loop (s)':>9} {'overhead (s)':>13} "
+              f"{'per line (us)':>14} {'flush (s)':>10}")
+
+        for name, log in cases.items():
+            seconds = run(log, messages, work_us)
+
+            start = time.perf_counter()
+            Logger.flush()
+            flush = time.perf_counter() - start
+
+            baseline = seconds if baseline is None else baseline
+            overhead = seconds - baseline
+
+            print(f'{name:>20} {seconds:>9.3f} {overhead:>13.3f} '
+                  f'{overhead / messages * 1e6:>14.2f} {flush:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Compares loading the model pickles with loading them as artifacts (memory
+mapped & lazy). Every load runs in a fresh process, which reports the load
+time, the first prediction time & its memory.
+
+The pickles are converted to artifacts in a temporary directory, then from
+the project root,
+
+> python -m benchmarks.model_loading --models-dir models
+
+RssAnon is memory private to the process, RssFile is memory mapped from
+files & shared by all the processes mapping the same artifact.
+"""
+from pathlib import Path
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import pandas as pd
+
+from src.data.preprocessing import Preprocessor
+from src.features.build_features import vocabulary_path
+from src.models.artifacts import save_artifact
+from src.models.model_factory import ModelFactory
+from src.models.predict_model import FEATURE_COLS, Predictor
+
+
+def memory():
+    """Resident memory of this process in MB, linux only."""
+    fields = {}
+
+    with open('/proc/self/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+
+            if name in ('VmRSS', 'RssAnon', 'RssFile'):
+                fields[name] = int(value.split()[0]) / 1024
+
+    return fields
+
+
+def measure(model_path, rows):
+    listings = pd.read_csv(str(Preprocessor.data_file), nrows=rows) \
+        .to_dict('records')
+
+    before = memory()['VmRSS']
+
+    start = time.perf_counter()
+    predictor = Predictor(model_path)
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predictor.predict(listings)
+    first_predict = time.perf_counter() - start
+
+    after = memory()
+
+    return {
+        'load (s)': load,
+        'first predict (s)': first_predict,
+        'rss (MB)': after['VmRSS'] - before,
+        'anon (MB)': after['RssAnon'],
+        'file (MB)': after['RssFile'],
+    }
+
+
+def run_child(model_path, rows):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.model_loading', '--child',
+         str(model_path), '--rows', str(rows)],
+        check=True, capture_output=True, text=True).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def size_mb(path):
+    files = [path] if path.is_file() else list(path.iterdir())
+    return sum(f.stat().st_size for f in files) / 1024 ** 2
+
+
+@click.command()
+@click.option('--models-dir', default='models', type=click.Path(exists=True),
+              help='Directory with the <name>_model.pkl pickles.')
+@click.option('--rows', default=1000, help='Listings of the first prediction.')
+@click.option('--child', default=None, hidden=True)
+def main(models_dir, rows, child):
+    if child:
+        print(json.dumps(measure(child, rows)))
+        return
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in ModelFactory.models:
+            pickle_path = Path(models_dir) / f'{name}_model.pkl'
+
+            if not pickle_path.exists():
+                continue
+
+            model = ModelFactory().get_model(name)
+            predictor = Predictor(pickle_path, log_target=model.log_target)
+            artifact_path = save_artifact(
+                predictor.pipe, Path(tmp_dir) / f'{name}_model',
+                pd.DataFrame(columns=FEATURE_COLS),
+                log_target=model.log_target)
+
+            # without a vocabulary the artifact would be loaded to read it
+            predictor.vocabulary.save(vocabulary_path(artifact_path))
+
+            for fmt, path in [('pickle', pickle_path),
+                              ('artifact', artifact_path)]:
+                results.append({'model': name, 'format': fmt,
+                                'size (MB)': size_mb(path),
+                                **run_child(path, rows)})
+
+    print(pd.DataFrame(results).round(3).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
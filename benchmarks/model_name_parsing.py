@@ -0,0 +1,98 @@
+"""
+Compares parsing every listing title with the cached, distinct titles only
+parsing of `parse_model_names` for different shares of distinct titles.
+
+> python -m benchmarks.model_name_parsing --rows 1000000
+"""
+import string
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from src.data.preprocessing import Preprocessor
+from src.features.build_features import (ENGINE_RE, clear_parse_cache,
+                                         parse_cache_info, parse_model_names)
+
+
+def make_titles(titles, rows, unique_ratio, seed=42):
+    """`rows` titles with about `unique_ratio` of them distinct, made by
+    adding a letters only suffix to the real titles."""
+    rng = np.random.default_rng(seed)
+    num_unique = max(1, int(rows * unique_ratio))
+
+    base = titles[rng.integers(0, len(titles), num_unique)]
+    suffixes = [_letters(i) for i in range(num_unique)]
+    uniques = np.array([f'{title} {suffix}'
+                        for title, suffix in zip(base, suffixes)],
+                       dtype=object)
+
+    return pd.Series(uniques[rng.integers(0, num_unique, rows)])
+
+
+def _letters(i):
+    # digits in the suffix could be taken as the engine or the year
+    letters = ''
+
+    while True:
+        i, rem = divmod(i, 26)
+        letters += string.ascii_lowercase[rem]
+
+        if not i:
+            return letters
+
+
+def parse_per_row(titles):
+    """Every row parsed with pandas string methods."""
+    return pd.DataFrame({
+        'brand': titles.str.split(n=1).str[0],
+        'engine': pd.to_numeric(titles.str.extract(ENGINE_RE, expand=False)),
+    })
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+@click.command()
+@click.option('--rows', default=1_000_000, help='Titles parsed per run.')
+@click.option('--ratios', default='0.001,0.01,0.1,0.5,1.0',
+              help='Comma separated shares of distinct titles.')
+def main(rows, ratios):
+    titles = pd.read_csv(str(Preprocessor.data_file))['model_name'] \
+        .dropna().unique()
+
+    print(f"{'unique ratio':>12} {'per row (s)':>12} {'cold (s)':>9} "
+          f"{'warm (s)':>9} {'speedup':>8} {'warm hit rate':>14}")
+
+    for ratio in [float(r) for r in ratios.split(',')]:
+        sample = make_titles(titles, rows, ratio)
+
+        slow, expected = timed(lambda: parse_per_row(sample))
+
+        clear_parse_cache()
+        cold, actual = timed(lambda: parse_model_names(sample))
+
+        # the same titles again, like a server seeing repeated listings
+        before = parse_cache_info()
+        warm, _ = timed(lambda: parse_model_names(sample))
+        after = parse_cache_info()
+
+        pd.testing.assert_series_equal(
+            expected['brand'], actual['brand'], check_names=False)
+        pd.testing.assert_series_equal(
+            expected['engine'], actual['engine'].astype(float),
+            check_names=False)
+
+        hits = after['hits'] - before['hits']
+        lookups = hits + after['misses'] - before['misses']
+
+        print(f'{ratio:>12} {slow:>12.2f} {cold:>9.2f} {warm:>9.2f} '
+              f'{slow / cold:>7.1f}x {hits / lookups:>14.1%}')
+
+
+if __name__ == '__main__':
+    main()
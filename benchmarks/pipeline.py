@@ -0,0 +1,237 @@
+"""
+Times & memory profiles every stage of the training pipeline, the same
+stages `src.models.train_model` chains, on synthetic listings.
+
+    load        read the raw csv
+    preprocess  `Preprocessor.clean`
+    features    `FeatureBuilder.make_features`
+    outliers    `Outliers.detect`
+    train:<m>   `Model.train` of each model, cross validation included
+    save:<m>    `Model.save` of each model
+
+Each stage reports its wall time, the peak of the memory allocated while it
+ran (tracemalloc) & the max resident memory of the process so far. The
+results are saved as JSON along with the machine they ran on. Given a
+previous result as `--baseline`, stages which got slower or use more memory
+than `--tolerance` allows are flagged & the command exits with status 1.
+
+> python -m benchmarks.pipeline --sizes 10000,100000
+> python -m benchmarks.pipeline --baseline reports/benchmarks/pipeline.json
+
+The results are saved in `reports/benchmarks/pipeline.json` unless
+`--output` says otherwise.
+
+tracemalloc slows down pure python code, `--no-memory` gives cleaner times.
+"""
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import click
+import pandas as pd
+
+from benchmarks.synthetic import make_listings
+from src.data.preprocessing import Preprocessor
+from src.features.build_features import FeatureBuilder, clear_parse_cache
+from src.features.outliers import Outliers
+from src.models.artifacts import versions
+from src.models.model_factory import ModelFactory
+
+
+# changes smaller than these are noise, never flagged
+MIN_SECONDS = .05
+MIN_MB = 1
+
+
+def total_memory_mb():
+    try:
+        with open('/proc/meminfo') as f:
+            return int(f.readline().split()[1]) / 1024
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], check=True,
+            capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'memory_mb': total_memory_mb(),
+        'commit': git_commit(),
+        'versions': versions(),
+    }
+
+
+def max_rss_mb():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(func, memory=True):
+    """Runs `func` & returns its result with the time & memory it took."""
+    if memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    peak_mb = None
+
+    if memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+
+    return result, {'seconds': seconds, 'peak_mb': peak_mb,
+                    'max_rss_mb': max_rss_mb()}
+
+
+def run_pipeline(rows, model_names, memory=True, seed=42):
+    """Runs every stage on `rows` synthetic listings, yields their results."""
+    # the model name cache would carry over from the previous size
+    clear_parse_cache()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file = Path(tmp_dir) / 'data.csv'
+        make_listings(rows, seed).to_csv(data_file, index=False)
+
+        preprocessor = Preprocessor()
+        preprocessor.data_file = data_file
+
+        def stage(name, func):
+            result, stats = measure(func, memory)
+            return result, {'rows': rows, 'stage': name, **stats}
+
+        _, result = stage('load', preprocessor.load_data)
+        yield result
+
+        df, result = stage('preprocess', preprocessor.clean)
+        yield result
+
+        builder = FeatureBuilder()
+        builder.df = df
+        df, result = stage('features', builder.make_features)
+        yield result
+
+        df, result = stage('outliers', Outliers(df).detect)
+        yield result
+
+        for name in model_names:
+            model = ModelFactory.models[name](df)
+
+            _, result = stage(f'train:{name}', model.train)
+            yield result
+
+            _, result = stage(
+                f'save:{name}',
+                lambda: model.save(Path(tmp_dir) / f'{name}_model'))
+            yield result
+
+
+def compare(results, baseline, tolerance):
+    """Adds the baseline numbers to the results & flags the regressions."""
+    base = {(r['rows'], r['stage']): r for r in baseline['results']}
+
+    for result in results:
+        before = base.get((result['rows'], result['stage']))
+
+        if before is None:
+            continue
+
+        result['baseline_seconds'] = before['seconds']
+        result['baseline_peak_mb'] = before.get('peak_mb')
+
+        slower = result['seconds'] - before['seconds']
+
+        # without --memory on both runs there's nothing to compare
+        if result['peak_mb'] is None or before.get('peak_mb') is None:
+            more = 0
+        else:
+            more = result['peak_mb'] - before['peak_mb']
+
+        result['regression'] = bool(
+            (slower > MIN_SECONDS
+             and slower > before['seconds'] * tolerance)
+            or (more > MIN_MB and more > before['peak_mb'] * tolerance))
+
+    return results
+
+
+@click.command()
+@click.option('--sizes', default='10000,100000',
+              help='Comma separated listing counts, up to 10000000.')
+@click.option('--model', 'model_names', multiple=True,
+              type=click.Choice(list(ModelFactory.models)),
+              help='Models to train, defaults to all of them.')
+@click.option('--memory/--no-memory', default=True,
+              help='Trace the memory allocated by each stage.')
+@click.option('--output', default='reports/benchmarks/pipeline.json',
+              type=click.Path(), help='JSON file to save the results to.')
+@click.option('--baseline', default=None, type=click.Path(exists=True),
+              help='Results of an earlier run to compare against.')
+@click.option('--tolerance', default=.2,
+              help='Allowed slow down or memory growth, .2 is 20%.')
+@click.option('--seed', default=42)
+def main(sizes, model_names, memory, output, baseline, tolerance, seed):
+    # sklearn & pandas deprecation warnings would bury the results
+    warnings.filterwarnings('ignore')
+
+    model_names = list(model_names) or list(ModelFactory.models)
+    results = []
+
+    for rows in [int(s) for s in sizes.split(',')]:
+        for result in run_pipeline(rows, model_names, memory, seed):
+            results.append(result)
+            print(f"{rows:>10} {result['stage']:>26} "
+                  f"{result['seconds']:>9.3f}s")
+
+    if baseline:
+        with open(baseline) as f:
+            results = compare(results, json.load(f), tolerance)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'machine': machine_info(),
+        'options': {'models': model_names, 'memory': memory, 'seed': seed},
+        'results': results,
+    }
+
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    print(pd.DataFrame(results).round(3).to_string(index=False))
+
+    regressions = [r for r in results if r.get('regression')]
+
+    for r in regressions:
+        print(f"Regression: {r['stage']} on {r['rows']} rows, "
+              f"{r['baseline_seconds']:.3f}s -> {r['seconds']:.3f}s, "
+              f"{r['baseline_peak_mb'] or 0:.1f} -> "
+              f"{r['peak_mb'] or 0:.1f} MB")
+
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Compares the row-wise & vectorized cleaning paths of `Preprocessor`.
+
+Run from the project root,
+
+> python -m benchmarks.preprocessing --sizes 100000,1000000,10000000
+"""
+import time
+
+import click
+import pandas as pd
+
+from src.data.preprocessing import Preprocessor
+
+
+def make_sample(raw: pd.DataFrame, size: int):
+    """Resamples the raw listings to the requested number of rows."""
+    return raw.sample(size, replace=True, random_state=42) \
+        .reset_index(drop=True)
+
+
+def time_clean(df: pd.DataFrame, vectorized: bool):
+    preprocessor = Preprocessor(vectorized=vectorized)
+    preprocessor.df = df.copy()
+
+    start = time.perf_counter()
+    cleaned = preprocessor.clean()
+
+    return time.perf_counter() - start, cleaned
+
+
+@click.command()
+@click.option('--sizes', default='100000,1000000,10000000',
+              help='Comma separated row counts to benchmark.')
+def main(sizes):
+    raw = pd.read_csv(str(Preprocessor.data_file))
+
+    print(f"{'rows':>12} {'row-wise (s)':>14} {'vectorized (s)':>16} "
+          f"{'speedup':>9}")
+
+    for size in [int(s) for s in sizes.split(',')]:
+        df = make_sample(raw, size)
+
+        slow, expected = time_clean(df, vectorized=False)
+        fast, actual = time_clean(df, vectorized=True)
+
+        pd.testing.assert_frame_equal(expected, actual)
+
+        print(f'{size:>12} {slow:>14.2f} {fast:>16.2f} {slow / fast:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
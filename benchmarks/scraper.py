@@ -0,0 +1,68 @@
+"""
+Compares pages/minute of the serial & the concurrent droom scrapper.
+
+Both scrappers run against `StubDroomServer` with a temporary database.
+
+> python -m benchmarks.scraper --pages 5 --latency-ms 50 --rate 100
+"""
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from src.data.scrapper import ConcurrentDroomScrapper, DroomScrapper
+from src.database.db import DB
+
+from .stub_server import StubDroomServer
+
+
+def run(scrapper_class, server, pages, per_page, db_path):
+    DB.DB_NAME = str(db_path)
+
+    scrapper_class = type(scrapper_class.__name__, (scrapper_class,), {
+        'per_page': per_page,
+        'total_listings': pages * per_page,
+    })
+    server.configure(scrapper_class)
+
+    scrapper = scrapper_class()
+
+    start = time.perf_counter()
+    scrapper.start()
+    elapsed = time.perf_counter() - start
+
+    return elapsed, len(scrapper.model.all())
+
+
+@click.command()
+@click.option('--pages', default=5, help='Number of listing pages to scrap.')
+@click.option('--per-page', default=48, help='Listings on each page.')
+@click.option('--latency-ms', default=50.0, help='Stub server response delay.')
+@click.option('--rate', default=100.0,
+              help='Requests per second allowed by the concurrent scrapper.')
+@click.option('--serial-sleep', default=0.0,
+              help='Sleep between listings of the serial scrapper, '
+                   'the real scrapper sleeps 1 second.')
+def main(pages, per_page, latency_ms, rate, serial_sleep):
+    DroomScrapper.sleep_for = serial_sleep
+    ConcurrentDroomScrapper.requests_per_sec = rate
+
+    print(f"{'scrapper':>12} {'pages':>6} {'rows':>6} {'time (s)':>9} "
+          f"{'pages/min':>10}")
+
+    with StubDroomServer(latency_ms) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+
+        for name, scrapper_class in [('serial', DroomScrapper),
+                                     ('concurrent', ConcurrentDroomScrapper)]:
+            db_path = Path(tmp_dir) / f'{name}.db'
+            elapsed, rows = run(scrapper_class, server, pages, per_page,
+                                db_path)
+
+            print(f'{name:>12} {pages:>6} {rows:>6} {elapsed:>9.2f} '
+                  f'{pages / elapsed * 60:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
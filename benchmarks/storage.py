@@ -0,0 +1,75 @@
+"""
+Compares load time & disk size of the dataset storage formats.
+
+Both the cleaned dataset & the features dataset are saved in every format
+of `DatasetStore`, then loaded fully & with a column projection.
+
+> python -m benchmarks.storage --rows 1000000
+"""
+import tempfile
+import time
+
+import click
+
+from src.data.preprocessing import Preprocessor
+from src.data.storage import STORAGES, DatasetStore
+from src.features.build_features import FeatureBuilder
+
+
+def timed(func, repeat=3):
+    """Returns the best wall time of `repeat` calls along with the result."""
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+
+def make_datasets(rows):
+    preprocessor = Preprocessor()
+    preprocessor.load_data()
+    cleaned = preprocessor.clean()
+
+    # resampled after cleaning, otherwise the duplicates would be removed
+    if rows:
+        cleaned = cleaned.sample(rows, replace=True, random_state=42)
+
+    cleaned = cleaned.reset_index(drop=True)
+
+    builder = FeatureBuilder()
+    builder.df = cleaned.copy()
+
+    return {'data': cleaned, 'features': builder.make_features()}
+
+
+@click.command()
+@click.option('--rows', default=0, type=int,
+              help='Resample the cleaned data to this many rows, 0 keeps it '
+                   'as is.')
+def main(rows):
+    datasets = make_datasets(rows)
+    projection = ['location', 'price']
+
+    print(f"{'dataset':>10} {'format':>8} {'rows':>10} {'size (MB)':>10} "
+          f"{'save (s)':>9} {'load (s)':>9} {'2 cols (s)':>11}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, df in datasets.items():
+            for fmt in STORAGES:
+                store = DatasetStore(fmt, data_dir=tmp_dir)
+
+                save_time, path = timed(lambda: store.save(df, name), 1)
+                load_time, _ = timed(lambda: store.load(name))
+                proj_time, _ = timed(lambda: store.load(name, projection))
+                size = path.stat().st_size / 1024 ** 2
+
+                print(f'{name:>10} {fmt:>8} {len(df):>10} {size:>10.2f} '
+                      f'{save_time:>9.3f} {load_time:>9.3f} '
+                      f'{proj_time:>11.3f}')
+
+
+if __name__ == '__main__':
+    main()
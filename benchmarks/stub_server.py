@@ -0,0 +1,97 @@
+"""
+Local HTTP server which serves recorded droom.in responses.
+
+The search API returns the listings of `fixtures/droom_search.json` with a
+unique alias per page & every product page returns the same recorded HTML,
+so the scrappers can be run without touching the real website.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+import json
+import threading
+import time
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+
+        url = urlparse(self.path)
+
+        if url.path == '/v2/search':
+            self._send(json.dumps(self._search(parse_qs(url.query))),
+                       'application/json')
+        elif url.path.startswith('/product/'):
+            self._send(self.server.product_html, 'text/html')
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _search(self, query):
+        page = int(query['page'][0])
+        rows = int(query['rows_per_page'][0])
+        templates = self.server.search['data']['listings']
+
+        listings = []
+
+        for i in range(rows):
+            listing = dict(templates[i % len(templates)])
+            listing['listing_alias'] += f'-{page}-{i}'
+            listings.append(listing)
+
+        return {'data': {'listings': listings}}
+
+    def _send(self, body, content_type):
+        body = body.encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubDroomServer(ThreadingHTTPServer):
+    """
+    Serves the fixtures on a random local port, use as a context manager.
+
+    Params:
+    latency_ms (float): delay added to every response.
+    """
+
+    daemon_threads = True
+
+    request_queue_size = 128
+
+    def __init__(self, latency_ms=0):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.latency = latency_ms / 1000
+        self.search = json.loads(
+            (FIXTURES_DIR / 'droom_search.json').read_text())
+        self.product_html = (FIXTURES_DIR / 'droom_product.html').read_text()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def configure(self, scrapper_class):
+        """Points a `DroomScrapper` class at this server."""
+        scrapper_class.api_url = (
+            self.url + '/v2/search?page={}&rows_per_page={}')
+        scrapper_class.product_base_url = self.url + '/product/'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
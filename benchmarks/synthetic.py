@@ -0,0 +1,56 @@
+"""
+Generates synthetic listings shaped like `data/raw/data.csv`, at any size.
+
+Rows are drawn from the scrapped listings so the model names, locations &
+the relations between the columns stay realistic, then the kms driven &
+the price are jittered so the rows are not plain duplicates (which the
+cleaning would drop).
+
+> python -m benchmarks.synthetic --rows 1000000 --output data/interim/1m.csv
+"""
+import click
+import numpy as np
+import pandas as pd
+
+from src.data.preprocessing import Preprocessor
+
+
+def make_listings(rows, seed=42, source=None):
+    """
+    Returns `rows` synthetic raw listings.
+
+    Params:
+    rows (int): number of listings.
+    seed (int): same seed, same listings.
+    source (str): raw listings to draw from, `Preprocessor.data_file` by
+    default.
+    """
+    raw = pd.read_csv(str(source or Preprocessor.data_file))
+    rng = np.random.default_rng(seed)
+
+    df = raw.iloc[rng.integers(0, len(raw), rows)].reset_index(drop=True)
+
+    # only the well formed "<n> Km" values, the odd ones are kept as they are
+    kms = pd.to_numeric(
+        df['kms_driven'].str.extract(r'^(\d+) Km$', expand=False))
+    jittered = (kms * rng.lognormal(0, .2, rows)).round()
+    df['kms_driven'] = df['kms_driven'].where(
+        kms.isna(), jittered.map('{:.0f} Km'.format))
+
+    price = df['price'] * rng.uniform(.9, 1.1, rows)
+    df['price'] = (price.round(-2)).where(df['price'] > 0, 0).astype('int64')
+
+    return df
+
+
+@click.command()
+@click.option('--rows', default=100_000, help='Number of listings.')
+@click.option('--seed', default=42)
+@click.option('--output', required=True, type=click.Path(),
+              help='csv file to write the listings to.')
+def main(rows, seed, output):
+    make_listings(rows, seed).to_csv(output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Compares visited link lookups with a full table scan, the unique index &
+the bloom filter in front of the index.
+
+Half of the looked up links are visited, like when a stopped scrapping is
+resumed. The bloom filter helps most when nearly all links are new.
+
+> python -m benchmarks.visited_lookup --links 200000 --lookups 20000
+"""
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from src.database.db import DB
+from src.database.models import UrlVisited
+
+
+def links(start, stop):
+    return [f'https://droom.in/product/listing-{i}'
+            for i in range(start, stop)]
+
+
+def time_lookups(find, queries):
+    start = time.perf_counter()
+
+    for link in queries:
+        find(link)
+
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option('--links', 'total', default=200_000, help='Visited links saved.')
+@click.option('--lookups', default=20_000, help='Links looked up.')
+@click.option('--new-share', default=0.5,
+              help='Share of the looked up links which are not visited.')
+def main(total, lookups, new_share):
+    saved = links(0, total)
+    new = int(lookups * new_share)
+    queries = links(0, lookups - new) + links(total, total + new)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        DB.DB_NAME = str(Path(tmp_dir) / 'visited.db')
+
+        con = sqlite3.connect(DB.DB_NAME)
+        con.execute('CREATE TABLE visted (link TEXT)')
+        con.executemany('INSERT INTO visted VALUES (?)',
+                        [(link,) for link in saved])
+        con.commit()
+
+        # only 1000 lookups, a full scan per lookup is too slow for more
+        scan_queries = queries[:500] + queries[-500:]
+        scan_time = time_lookups(
+            lambda link: con.execute(
+                'SELECT * FROM visted WHERE link=?', (link,)).fetchone(),
+            scan_queries)
+
+        start = time.perf_counter()
+        visited = UrlVisited()
+        warm_time = time.perf_counter() - start
+
+        index_time = time_lookups(
+            lambda link: con.execute(
+                'SELECT * FROM visted WHERE link=?', (link,)).fetchone(),
+            queries)
+
+        bloom_time = time_lookups(visited.find, queries)
+
+    print(f'index creation & bloom filter warm up : {warm_time:.2f}s')
+    print(f"{'lookup':>16} {'lookups/sec':>12} {'avg (us)':>9}")
+
+    for name, elapsed, count in [
+            ('full scan', scan_time, len(scan_queries)),
+            ('unique index', index_time, len(queries)),
+            ('bloom + index', bloom_time, len(queries))]:
+        print(f'{name:>16} {count / elapsed:>12.0f} '
+              f'{elapsed / count * 1e6:>9.1f}')
+
+    print('bloom filter stats :', visited.stats.summary())
+
+
+if __name__ == '__main__':
+    main()
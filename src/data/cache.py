@@ -0,0 +1,161 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from ..utils.logger import Logger
+
+
+# bump to invalidate everything cached by older versions of the cache itself
+CACHE_VERSION = 1
+
+
+def file_hash(path, size=None, chunk_size=1024 ** 2):
+    """sha256 of the content of a file, of its first `size` bytes if given."""
+    digest = hashlib.sha256()
+    left = float('inf') if size is None else size
+
+    with open(path, 'rb') as f:
+        while left > 0:
+            chunk = f.read(int(min(chunk_size, left)))
+
+            if not chunk:
+                break
+
+            digest.update(chunk)
+            left -= len(chunk)
+
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    Content addressed cache of the frames made by the pipeline stages.
+
+    An output is stored under a key made of the stage name, the version of
+    the stage code, its params & its inputs: the hash of the input files or
+    the keys of the stages it ran on. Anything changing gives a new key, so
+    entries are never stale, they are just not used anymore.
+
+    Each entry is a pickled frame (exact dtypes & index) & a JSON file of
+    what else the stage learnt, e.g the feature vocabulary. Once the entries
+    add up to more than `max_bytes` the least recently used are deleted.
+
+    Params:
+    cache_dir (str): directory of the entries.
+    max_bytes (int): size the cache is kept under.
+    """
+
+    def __init__(self, cache_dir='data/interim/cache',
+                 max_bytes=1024 ** 3):
+        self.logger = Logger(__name__, __name__ == '__main__')
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, stage, version, files=(), parents=(), params=None):
+        """
+        Key of a stage output.
+
+        Params:
+        stage (str): stage name.
+        version (int): version of the stage code, bumped when its output
+        changes.
+        files (list): input files, their content is hashed.
+        parents (list): keys of the stages whose output is the input.
+        params (dict): JSON serializable params of the stage.
+        """
+        content = json.dumps({
+            'cache_version': CACHE_VERSION,
+            'stage': stage,
+            'version': version,
+            'files': [file_hash(path) for path in files],
+            'parents': list(parents),
+            'params': params or {},
+        }, sort_keys=True, default=str)
+
+        return f'{stage}-{hashlib.sha256(content.encode()).hexdigest()[:32]}'
+
+    def get(self, key):
+        """The frame & metadata stored under `key`, (None, None) if missing."""
+        path = self._frame_path(key)
+        meta_path = self._meta_path(key)
+
+        # a frame without its metadata is recomputed & stored again
+        if not path.exists() or not meta_path.exists():
+            self.misses += 1
+            return None, None
+
+        self.hits += 1
+
+        # the modified time orders the entries for eviction
+        os.utime(path)
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        return pd.read_pickle(path), meta
+
+    def put(self, key, df, meta=None):
+        path = self._frame_path(key)
+        tmp_path = path.with_suffix('.tmp')
+
+        with open(self._meta_path(key), 'w') as f:
+            json.dump(meta or {}, f)
+
+        # renamed once complete, an interrupted write is never read
+        df.to_pickle(tmp_path)
+        tmp_path.replace(path)
+
+        self.logger.info(f'Cached {key} ({path.stat().st_size} bytes)')
+
+        self.evict()
+
+    def cached(self, key, compute):
+        """
+        The output of a stage, from the cache or by calling `compute`, which
+        returns the frame & its metadata.
+        """
+        df, meta = self.get(key)
+
+        if df is not None:
+            self.logger.info(f'Using cached {key}')
+            return df, meta
+
+        df, meta = compute()
+        self.put(key, df, meta)
+
+        return df, meta
+
+    def evict(self):
+        """Deletes the least recently used entries over `max_bytes`."""
+        entries = sorted(self.cache_dir.glob('*.pkl'),
+                         key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in entries)
+
+        # the newest entry is kept, even if it's bigger than the cache
+        for path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+
+            total -= path.stat().st_size
+            path.unlink()
+            path.with_suffix('.json').unlink(missing_ok=True)
+
+            self.logger.info(f'Evicted {path.stem} from the stage cache')
+
+    def clear(self):
+        for path in self.cache_dir.glob('*.pkl'):
+            path.unlink()
+            path.with_suffix('.json').unlink(missing_ok=True)
+
+    def _frame_path(self, key):
+        return self.cache_dir / f'{key}.pkl'
+
+    def _meta_path(self, key):
+        return self.cache_dir / f'{key}.json'
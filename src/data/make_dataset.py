@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 import click
 from pathlib import Path
+import json
 from dotenv import find_dotenv, load_dotenv
-from ..database.models import BikeModel
+from ..database.models import BikeModel, BikeListingModel
 import pandas as pd
 from ..utils.logger import Logger
 import sys
@@ -11,23 +12,93 @@ from .scrapper import start_scrapper
 logger = Logger(__name__, std_out=True)
 
 
-def table_to_csv(query, db_con, save_path):
-    df = pd.read_sql_query(query, db_con)
-    logger.info(f'Saving raw data into {save_path}')
-    df.to_csv(save_path,index=False)
+CHUNK_SIZE = 50_000
 
 
-def main():
+def export_state_path(save_path):
+    return Path(f'{save_path}.state.json')
+
+
+def export_table(model, save_path, incremental=False, chunk_size=CHUNK_SIZE):
+    """
+    Exports the `EXPORT_COLUMNS` of the model table into a csv.
+
+    In incremental mode only the rows added since the last export are
+    appended, the last exported rowid is kept next to the csv in
+    `<save_path>.state.json`. A full export is done when there is no state
+    for the table or the csv is missing.
+
+    Rows are read by rowid & appended in chunks, so the table is never
+    fully loaded. A replaced `bike_listings` row gets a new rowid & is
+    appended again, the duplicates are dropped by `Preprocessor`.
+
+    Returns the number of rows written.
+    """
+    model.flush()
+
+    save_path = Path(save_path)
+    state_path = export_state_path(save_path)
+    last_rowid = 0
+
+    if incremental and save_path.exists() and state_path.exists():
+        state = json.loads(state_path.read_text())
+
+        if state.get('table') == model.TABLE_NAME:
+            last_rowid = state['last_rowid']
+
+    append = last_rowid > 0
+    total_rows = 0
+
+    logger.info(
+        f'Exporting {model.TABLE_NAME} rows after rowid {last_rowid} '
+        f'into {save_path}')
+
+    chunks = pd.read_sql_query(
+        f"select rowid as row_id, {','.join(model.EXPORT_COLUMNS)} "
+        f"from {model.TABLE_NAME} where rowid > ? order by rowid",
+        model.con, params=(last_rowid,), dtype=model.DTYPES,
+        chunksize=chunk_size)
+
+    for df in chunks:
+        # an empty chunk is given when there are no new rows
+        if df.empty:
+            continue
+
+        df.drop(columns='row_id').to_csv(
+            save_path, index=False, mode='a' if append else 'w',
+            header=not append)
+
+        append = True
+        last_rowid = int(df['row_id'].iloc[-1])
+        total_rows += len(df)
+
+        # saved after every chunk so a failed export resumes from there
+        state_path.write_text(json.dumps(
+            {'table': model.TABLE_NAME, 'last_rowid': last_rowid}))
+
+    logger.info(f'Exported {total_rows} rows into {save_path}')
+
+    return total_rows
+
+
+# extra args are accepted as the Makefile passes the data directories
+@click.command(context_settings={'ignore_unknown_options': True,
+                                 'allow_extra_args': True})
+@click.option('--typed', is_flag=True,
+              help='Export the cleaned & typed bike_listings table.')
+@click.option('--incremental', is_flag=True,
+              help='Append only the rows added since the last export.')
+def main(typed, incremental):
     """ Runs data processing scripts to turn raw data from (../raw) into
         cleaned data ready to be analyzed (saved in ../processed).
     """
 
     save_path = 'data/raw/data.csv'
 
-    model = BikeModel()
+    model = BikeListingModel() if typed else BikeModel()
     
-    if model.all():
-        table_to_csv(f'select * from {model.TABLE_NAME}', model.con,save_path)
+    if model.exists():
+        export_table(model, save_path, incremental)
         return
      
     user_input = input('Local database is empty. Would you like to start scrapping the data from source?(Y/N) : ')
@@ -39,7 +110,7 @@ def main():
     if user_input.lower() == 'y':
         start_scrapper()
         
-        table_to_csv(f'select * from {model.TABLE_NAME}', model.con,save_path)
+        export_table(model, save_path, incremental)
 
     sys.exit()
 
@@ -1,16 +1,240 @@
+from io import BytesIO
 from pathlib import Path
+import re
 import pandas as pd
 import numpy as np
+from pandas.api.types import is_numeric_dtype
 from src.utils.logger import Logger
+from src.utils.profiling import profiled
+from .storage import DatasetStore
+
+
+# columns of the raw listings in `data/raw/data.csv`
+RAW_COLS = ['model_name', 'model_year', 'kms_driven', 'owner', 'location',
+            'mileage', 'power', 'price']
+
+# matches what int() accepts once the 'km'/'kms' unit has been removed,
+# including underscores between digits & non ASCII digits, e.g '1_000'
+KMS_DRIVEN_RE = re.compile(r'^\s*([+-]?\d+(?:_\d+)*)\s*$')
+
+
+def _falsy(series):
+    """Vectorized version of `not val` for the values read_csv produces.
+
+    NaN is truthy in python so it is never treated as falsy here.
+    """
+    if is_numeric_dtype(series):
+        return series == 0
+
+    return series.isin(['', 0])
+
+
+def _map_unique(series, clean):
+    """Cleans every distinct value once & maps the result back to all rows.
+
+    Scrapped listings repeat the same few strings over & over, so this is
+    much cheaper than running the string methods over every row.
+    """
+    uniques = series.drop_duplicates()
+    cleaned = clean(uniques)
+
+    return series.map(pd.Series(cleaned.values, index=uniques.values))
+
+
+def _parse_kms_driven(series):
+    kms = (series.str.lower()
+           .str.replace('kms', '', regex=False)
+           .str.replace('km', '', regex=False))
+
+    # values containing 'mileage' never match the pattern, so they are NaN
+    digits = kms.str.extract(KMS_DRIVEN_RE, expand=False)
+    values = pd.to_numeric(digits, errors='coerce')
+
+    # to_numeric doesn't parse underscores & non ASCII digits, int() does
+    rare = values.isna() & digits.notna()
+
+    if rare.any():
+        values = values.astype(object)
+        values[rare] = digits[rare].map(int)
+        values = pd.to_numeric(values)
+
+    return values
+
+
+def _parse_owner(series):
+    owner = series.str.replace('owner', '', regex=False)
+    or_more = owner.str.lower().str.contains('or more', regex=False, na=False)
+
+    return owner.str.strip().mask(or_more, 'fourth')
+
+
+def _unit_parser(unit, lower=True):
+    def parse(series):
+        values = series.astype(str)
+
+        if lower:
+            values = values.str.lower()
+
+        values = pd.to_numeric(values.str.replace(unit, '', regex=False),
+                               errors='coerce')
+
+        return values.mask(_falsy(series))
+
+    return parse
+
+
+def _numeric_or_unique(series, parse):
+    if is_numeric_dtype(series):
+        return series.mask(series == 0)
+
+    return _map_unique(series, parse)
+
+
+def clean_kms_driven_series(series):
+    """Vectorized equivalent of `Preprocessor._clean_kms_driven`."""
+    if is_numeric_dtype(series):
+        return series
+
+    return _map_unique(series, _parse_kms_driven)
+
+
+def clean_price_series(series):
+    """Vectorized equivalent of `Preprocessor._clean_price`."""
+    return _numeric_or_unique(series, _unit_parser(',', lower=False))
+
+
+def clean_owner_series(series):
+    """Vectorized equivalent of `Preprocessor._clean_owner`."""
+    return _map_unique(series, _parse_owner)
+
+
+def clean_mileage_series(series):
+    """Vectorized equivalent of `Preprocessor._clean_mileage`."""
+    return _numeric_or_unique(series, _unit_parser('kmpl'))
+
+
+def clean_power_series(series):
+    """Vectorized equivalent of `Preprocessor._clean_power`."""
+    return _numeric_or_unique(series, _unit_parser('bhp'))
+
+
+def clean_listings(df):
+    """
+    Applies the row level cleaning of `Preprocessor` to raw listing records.
+
+    Unlike `Preprocessor.clean` no rows or columns are dropped, so the output
+    lines up with the input. Used to clean listings at prediction time.
+    """
+    # listings sent for prediction might not have all the details, missing
+    # ones are NaN whatever the other listings of the batch have
+    df = df.reindex(columns=list(dict.fromkeys([*df.columns, *RAW_COLS])))
+
+    for col in RAW_COLS:
+        if df[col].isna().all():
+            df[col] = pd.Series(np.nan, index=df.index, dtype=object)
+
+    for col in df.select_dtypes(include='object').columns:
+        df[col] = _map_unique(df[col], lambda values: values.str.strip())
+
+    df['kms_driven'] = clean_kms_driven_series(df['kms_driven'])
+    df['price'] = clean_price_series(df['price'])
+    df['owner'] = clean_owner_series(df['owner'])
+    df['mileage'] = clean_mileage_series(df['mileage'])
+    df['power'] = clean_power_series(df['power'])
+
+    for col in Preprocessor.numeric_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    return df
+
+
+class RowHashIndex:
+    """
+    Remembers which rows have been seen using 64 bit row hashes.
+
+    The hashes are kept in a sorted numpy array, so it costs 8 bytes per
+    unique row instead of keeping the rows themselves around.
+    """
+
+    def __init__(self, hashes=()):
+        self._hashes = np.sort(np.asarray(hashes, dtype=np.uint64))
+
+    def __len__(self):
+        return len(self._hashes)
+
+    @property
+    def hashes(self):
+        return self._hashes
+
+    def add(self, df):
+        """Adds the rows of `df` & returns a mask of rows not seen before.
+
+        Only the first occurrence of a row within `df` is marked as new.
+        """
+        # ints & floats hash differently, a column can be either per chunk
+        numeric = df.select_dtypes(include='number').columns
+        hashes = pd.util.hash_pandas_object(
+            df.astype({col: 'float64' for col in numeric}),
+            index=False).to_numpy()
+
+        seen = np.zeros(len(hashes), dtype=bool)
+
+        if len(self._hashes):
+            pos = np.searchsorted(self._hashes, hashes)
+            pos[pos == len(self._hashes)] = 0
+            seen = self._hashes[pos] == hashes
+
+        new = ~seen & ~pd.Series(hashes).duplicated().to_numpy()
+
+        # both parts are already sorted, so the stable sort is only a merge
+        self._hashes = np.sort(
+            np.concatenate([self._hashes, np.sort(hashes[new])]),
+            kind='stable')
+
+        return new
+
+    def save(self, path):
+        np.save(path, self._hashes)
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
 
 
 class Preprocessor:
+    """
+    Cleans the raw scrapped data & makes it ready for feature building.
+
+    Params:
+    vectorized (bool): clean the columns using pandas string methods instead
+    of calling a python function per row. Both give the same output.
+    storage (str): format used to save the cleaned dataset, see `DatasetStore`.
+    """
     data_file = Path('data/raw/data.csv')
 
+    # name of the cleaned dataset in the `DatasetStore`
+    dataset = 'data'
+
+    # csv file written by `start_chunked`
     cleaned_file = Path('data/processed/data.csv')
 
-    def __init__(self):
+    # number of raw rows held in memory at once by `start_chunked`
+    chunk_size = 100_000
+
+    numeric_cols = ['kms_driven', 'price', 'mileage', 'power']
+
+    # read as text in every chunk, so a chunk full of NaN doesn't turn float
+    text_cols = ['model_name', 'kms_driven', 'owner',
+                 'location', 'mileage', 'power']
+
+    # bump when the cleaned output of the same raw file changes, see
+    # `StageCache`
+    cache_version = 1
+
+    def __init__(self, vectorized=True, storage=None):
         self.logger = Logger(__name__, __name__ == '__main__')
+        self.vectorized = vectorized
+        self.store = DatasetStore(storage)
 
         if not self.data_file.exists():
             err = f"File does not exist {self.data_file}"
@@ -18,13 +242,100 @@ class Preprocessor:
 
             raise FileNotFoundError(err)
 
-    def load_data(self):
-        self.df = pd.read_csv(str(self.data_file))
+    @profiled(rows='df')
+    def load_data(self, nbytes=None):
+        """Reads the raw file, only its first `nbytes` if given, e.g the
+        size it had before rows were appended to it."""
+        if nbytes is None:
+            self.df = pd.read_csv(str(self.data_file))
+        else:
+            with open(self.data_file, 'rb') as f:
+                self.df = pd.read_csv(BytesIO(f.read(nbytes)))
+
         return self.df
 
-    def start(self, save_file=False):
-        self.load_data()
+    def start(self, save_file=False, nbytes=None):
+        self.load_data(nbytes)
+        self.clean()
+
+        if save_file:
+            self.store.save(self.df, self.dataset)
+
+        return self.df
+
+    def start_chunked(self, chunk_size=None):
+        """
+        Cleans the raw file chunk by chunk & saves it at `cleaned_file`.
+
+        Only one chunk of the raw file is in memory at a time. Duplicates are
+        removed across chunks using row hashes & empty columns are dropped
+        with a second pass over the cleaned file. Numeric columns are always
+        saved as floats so every chunk is written the same way.
+
+        The output is always csv, load it with `DatasetStore('csv')`.
+
+        Returns the number of rows saved.
+        """
+        chunk_size = chunk_size or self.chunk_size
+
+        columns = pd.read_csv(str(self.data_file), nrows=0).columns
+        dtype = {col: str for col in self.text_cols if col in columns}
+
+        part_file = self.cleaned_file.with_suffix('.part')
+        seen_rows = RowHashIndex()
+        non_empty_cols = set()
+        total_rows = 0
+
+        self.logger.info(
+            f'Starting chunked cleaning process with chunk size {chunk_size}.')
+
+        chunks = pd.read_csv(str(self.data_file),
+                             chunksize=chunk_size, dtype=dtype)
+
+        for i, chunk in enumerate(chunks):
+            self.df = chunk
+            self._clean_rows()
+
+            self.df[self.numeric_cols] = self.df[self.numeric_cols].astype(
+                'float64')
+
+            non_empty_cols.update(self.df.columns[self.df.notna().any()])
+
+            new_rows = seen_rows.add(self.df)
+            self.logger.info(
+                f'Found {(~new_rows).sum()} duplicate records in chunk {i+1}.')
+            self.df = self.df[new_rows]
+
+            self.df.to_csv(str(part_file), index=False,
+                           mode='w' if i == 0 else 'a', header=i == 0)
+            total_rows += len(self.df)
+
+        empty_cols = [col for col in columns if col not in non_empty_cols]
+
+        if empty_cols:
+            self.logger.info(f'Dropping empty columns {empty_cols}.')
+            self._drop_cols_from_file(part_file, empty_cols, chunk_size)
+
+        part_file.replace(self.cleaned_file)
+
+        self.logger.info(
+            f'Saved {total_rows} cleaned records at {self.cleaned_file}')
+
+        return total_rows
+
+    @profiled(rows='df')
+    def clean(self):
+        """Runs all the cleaning steps on the loaded dataframe."""
         self.logger.info('Starting cleaning process.')
+        self._clean_rows()
+        self._drop_empty_cols()
+        self._remove_duplicates()
+
+        return self.df
+
+    @profiled(rows='df')
+    def _clean_rows(self):
+        """Cleaning steps which work on each row independently."""
         self._strip_features()
         self._clean_kms_driven()
         self._clean_price()
@@ -33,25 +344,34 @@ class Preprocessor:
         self._clean_power()
 
         self._fix_col_type()
-        self._drop_empty_cols()
-        self._remove_duplicates()
 
-        if save_file:
-            self.logger.info(f'Saving cleaned file at {self.cleaned_file}')
+    def _drop_cols_from_file(self, path, cols, chunk_size):
+        tmp_file = path.with_suffix('.tmp')
 
-            self.df.to_csv(str(self.cleaned_file), index=False)
+        chunks = pd.read_csv(str(path), chunksize=chunk_size,
+                             usecols=lambda col: col not in cols)
 
-        return self.df
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(str(tmp_file), index=False,
+                         mode='w' if i == 0 else 'a', header=i == 0)
 
+        tmp_file.replace(path)
+
+    @profiled(rows='df')
     def _strip_features(self):
         # if not self.df:
         #     return
 
         for col in self.df.select_dtypes(include='object').columns:
-            self.df[col] = self.df[col].str.strip()
+            if self.vectorized:
+                self.df[col] = _map_unique(
+                    self.df[col], lambda values: values.str.strip())
+            else:
+                self.df[col] = self.df[col].str.strip()
 
         self.logger.info('Stripping whitespaces from objects columns.')
 
+    @profiled(rows='df')
     def _clean_kms_driven(self):
         def clean_kms_driven(val):
             if not val:
@@ -73,9 +393,14 @@ class Preprocessor:
             except ValueError:
                 return np.nan
 
-        self.df['kms_driven'] = self.df.kms_driven.apply(clean_kms_driven)
+        if self.vectorized:
+            self.df['kms_driven'] = clean_kms_driven_series(self.df.kms_driven)
+        else:
+            self.df['kms_driven'] = self.df.kms_driven.apply(clean_kms_driven)
+
         self.logger.info('Cleaned `kms_driven` column.')
 
+    @profiled(rows='df')
     def _clean_price(self):
         def clean_price(val):
             """
@@ -92,9 +417,14 @@ class Preprocessor:
 
             return val
 
-        self.df['price'] = self.df['price'].apply(clean_price)
+        if self.vectorized:
+            self.df['price'] = clean_price_series(self.df['price'])
+        else:
+            self.df['price'] = self.df['price'].apply(clean_price)
+
         self.logger.info('Cleaned `price` column.')
 
+    @profiled(rows='df')
     def _clean_owner(self):
         """Removes 'owner' word form the data as it holds not value"""
         def clean_owner(val):
@@ -108,9 +438,14 @@ class Preprocessor:
 
             return val.strip()
 
-        self.df['owner'] = self.df['owner'].apply(clean_owner)
+        if self.vectorized:
+            self.df['owner'] = clean_owner_series(self.df['owner'])
+        else:
+            self.df['owner'] = self.df['owner'].apply(clean_owner)
+
         self.logger.info('Cleaned `owner` column.')
 
+    @profiled(rows='df')
     def _clean_mileage(self):
         def clean_mileage(val):
             if not val:
@@ -118,9 +453,14 @@ class Preprocessor:
 
             return str(val).lower().replace('kmpl', '')
 
-        self.df['mileage'] = self.df.mileage.apply(clean_mileage)
+        if self.vectorized:
+            self.df['mileage'] = clean_mileage_series(self.df.mileage)
+        else:
+            self.df['mileage'] = self.df.mileage.apply(clean_mileage)
+
         self.logger.info('Cleaned `mileage` column.')
 
+    @profiled(rows='df')
     def _clean_power(self):
         """Removes bhp word form the column."""
         def clean_power(val):
@@ -129,12 +469,17 @@ class Preprocessor:
 
             return str(val).lower().replace('bhp', '')
 
-        self.df['power'] = self.df.power.apply(clean_power)
+        if self.vectorized:
+            self.df['power'] = clean_power_series(self.df.power)
+        else:
+            self.df['power'] = self.df.power.apply(clean_power)
+
         self.logger.info('Cleaned `power` column.')
 
+    @profiled(rows='df')
     def _fix_col_type(self):
         """Fix the columns types"""
-        cols = ['kms_driven', 'price', 'mileage', 'power']
+        cols = self.numeric_cols
 
         for col in cols:
             self.df[col] = pd.to_numeric(
@@ -143,14 +488,16 @@ class Preprocessor:
 
         self.logger.info(f'Fixed dtype of columns {cols}.')
 
+    @profiled(rows='df')
     def _drop_empty_cols(self):
         self.df.dropna(how='all', axis=1, inplace=True)
         self.logger.info('Dropping empty columns.')
 
+    @profiled(rows='df')
     def _remove_duplicates(self):
-        dups_count = self.df.duplicated().sum()
-        self.logger.info(f'Found {dups_count} duplicate records.')
-        self.df = self.df[~self.df.duplicated()]
+        dups = self.df.duplicated()
+        self.logger.info(f'Found {dups.sum()} duplicate records.')
+        self.df = self.df[~dups]
         self.logger.info('Removed all the duplicates records.')
 
 
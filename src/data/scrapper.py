@@ -1,7 +1,12 @@
 import json
 from bs4 import BeautifulSoup
 import requests
-from ..database.models import BikeModel, UrlVisited
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from ..database.models import BikeModel, BikeListingModel, UrlVisited
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+import threading
 import time
 from ..utils.logger import Logger
 import math
@@ -9,6 +14,10 @@ from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
 
 
+# most per listing log lines per second, the rest are counted & dropped
+LOG_RATE_LIMIT = 20
+
+
 class Scrapper:
 
     source_name = None  # source of the data
@@ -21,7 +30,7 @@ class Scrapper:
 
     def __init__(self):
         self.model = BikeModel()
-        self.logger = Logger(__name__, std_out=True)
+        self.logger = Logger(__name__, std_out=True, rate_limit=LOG_RATE_LIMIT)
 
     def get_html_document(self, url):
         # request for HTML document of given url
@@ -67,16 +76,24 @@ class DroomScrapper:
 
     api_url = 'https://cdnaka.acedms.com/v2/search?bucket=bike&category=Motorcycle%2FBike&condition=used&include_premium=1&page={}&rows_per_page={}'
 
+    product_base_url = 'https://droom.in/product/'
+
     per_page = 48
 
+    total_listings = 38166
+
     sleep_for = 1
 
     data = []
 
+    # passed to the database models, see `DB`
+    db_options = {}
+
     def __init__(self):
-        self.model = BikeModel()
-        self.url_visted = UrlVisited()
-        self.logger = Logger(__name__, std_out=True)
+        self.model = BikeModel(**self.db_options)
+        self.listings = BikeListingModel(**self.db_options)
+        self.url_visted = UrlVisited(**self.db_options)
+        self.logger = Logger(__name__, std_out=True, rate_limit=LOG_RATE_LIMIT)
 
     def get_html_document(self, url):
         # request for HTML document of given url
@@ -85,50 +102,51 @@ class DroomScrapper:
         return response.text
 
     def get_total_pages(self):
-        return int(38166 / self.per_page)
+        return int(self.total_listings / self.per_page)
 
     
-    def extract_api(self, json_data):
+    def product_url(self, json_data):
+        return self.product_base_url + json_data.get('listing_alias')
 
-        bike_id = json_data.get('listing_alias')
+    def listing_data(self, json_data, html_document):
+        """Combines the API listing with the details from its product page."""
+        data = self.extract_html(html_document)
 
-        model = json_data.get('product_title')
+        if not data:
+            return None
 
-        price = json_data.get('total_payout_value')
+        locations = json_data.get('location')
 
-        owner = json_data.get('number_of_owners')
+        data['listing_id'] = json_data.get('listing_alias')
+        data['model_name'] = json_data.get('product_title')
+        data['price'] = json_data.get('total_payout_value')
+        data['owner'] = json_data.get('number_of_owners')
+        data['model_year'] = json_data.get('year')
+        data['location'] = locations[0] if locations else None
 
-        model_year = json_data.get('year')
+        return data
 
-        locations = json_data.get('location')
-
-        single_loc = None
+    def extract_api(self, json_data):
 
-        if locations:
-            single_loc = locations[0]
+        model = json_data.get('product_title')
 
         # extract other info from details page usig bs4
-        base_url = "https://droom.in/product/" + bike_id
+        base_url = self.product_url(json_data)
 
         if self.url_visted.find(base_url):
             return
 
-        data = self.extract_html(self.get_html_document(base_url))
+        data = self.listing_data(json_data, self.get_html_document(base_url))
 
         if not data:
             self.logger.info(
-                f'Could not find data of {model}.Skipping this...')
+                'Could not find data of %s.Skipping this...', model)
             return
 
-        data['model_name'] = model
-        data['price'] = price
-        data['owner'] = owner
-        data['model_year'] = model_year
-        data['location'] = single_loc
-
         self.model.save(data)
+        self.listings.save(data)
 
-        self.logger.info(f'Saving data of {model} to database...')
+        self.logger.info('Saving data of %s to database...', model)
 
         self.url_visted.save({'link': base_url})
 
@@ -195,7 +213,7 @@ class DroomScrapper:
                 if listings:
                     for item in listings:
                         self.extract_api(item)
-                        time.sleep(1)
+                        time.sleep(self.sleep_for)
             else:
                 self.logger.info(f'Data not found for page no. {i+1}')
 
@@ -203,9 +221,249 @@ class DroomScrapper:
             self.url_visted.save({'link': url})
             # time.sleep(self.sleep_for)
 
+        self.logger.info(
+            f'Visited link lookups: {self.url_visted.stats.summary()}')
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter which can be shared between threads.
+
+    Params:
+    rate (float): number of tokens added per second.
+    burst (int): maximum number of tokens the bucket can hold.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available & takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens +
+                                   (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait_for = (1 - self._tokens) / self.rate
+
+            time.sleep(wait_for)
+
+
+class ConcurrentDroomScrapper(DroomScrapper):
+    """
+    Scraps the data from www.droom.in using a pool of threads.
+
+    Listing pages & product pages are fetched in parallel over keep-alive
+    connections. Requests to each host are rate limited & the number of
+    requests in flight per host is bounded. Failed requests are retried
+    with exponential backoff. The database is only used from the calling
+    thread, already visited pages & products are skipped so a stopped
+    scrapping can be resumed.
+    """
+
+    max_workers = 16
+
+    # maximum requests in flight to a single host
+    max_per_host = 8
+
+    # requests per second allowed to each host
+    requests_per_sec = 10
+
+    retries = 3
+
+    backoff_factor = 0.5
+
+    timeout = 30
+
+    # rows are written in batches, at the latest when a page is finished
+    db_options = {
+        'batch_size': 1000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.session = self._make_session()
+        self._lock = threading.Lock()
+        self._rate_limiters = {}
+        self._host_slots = {}
+
+    def _make_session(self):
+        retry = Retry(total=self.retries, backoff_factor=self.backoff_factor,
+                      status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=4,
+                              pool_maxsize=self.max_workers, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
+    def _throttle(self, url):
+        host = urlparse(url).netloc
+
+        with self._lock:
+            if host not in self._rate_limiters:
+                self._rate_limiters[host] = RateLimiter(
+                    self.requests_per_sec, burst=self.max_per_host)
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    self.max_per_host)
+
+        return self._rate_limiters[host], self._host_slots[host]
+
+    def fetch(self, url):
+        rate_limiter, host_slots = self._throttle(url)
+        rate_limiter.acquire()
+
+        with host_slots:
+            response = self.session.get(url, timeout=self.timeout)
+
+        response.raise_for_status()
+        return response
+
+    def get_html_document(self, url):
+        return self.fetch(url).text
+
+    def fetch_listings(self, url):
+        data = self.fetch(url).json().get('data')
+        return (data.get('listings') or []) if data else None
+
+    def fetch_listing_data(self, json_data):
+        html = self.get_html_document(self.product_url(json_data))
+        return self.listing_data(json_data, html)
+
+    def start(self):
+        total_pages = self.get_total_pages()
+
+        self.logger.info(f'Started scrapping data from {self.source_name}')
+        self.logger.info(f'Total Pages Found {total_pages}.')
+
+        pages = iter(range(total_pages))
+        pending = {}
+        listings_left = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+
+            def submit_page():
+                for i in pages:
+                    url = self.api_url.format(i+1, self.per_page)
+
+                    if self.url_visted.find(url):
+                        self.logger.info(f'Already processed page no. {i+1}')
+                        continue
+
+                    pending[pool.submit(self.fetch_listings, url)] = (
+                        'page', url, i+1)
+                    return
+
+            # only a few pages are in flight, the rest of the pool is left
+            # for the product pages of the listings found
+            for _ in range(max(1, self.max_workers // 4)):
+                submit_page()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    kind, url, detail = pending.pop(future)
+
+                    if kind == 'page':
+                        submit_page()
+                        self._page_done(pool, pending, listings_left,
+                                        future, url, detail)
+                    else:
+                        self._listing_done(listings_left, future, url, detail)
+
+        self.model.flush()
+        self.listings.flush()
+        self.url_visted.flush()
+
+        self.logger.info(f'Finished scrapping data from {self.source_name}')
+        self.logger.info(
+            f'Visited link lookups: {self.url_visted.stats.summary()}')
+
+    def _page_done(self, pool, pending, listings_left, future, url, page_no):
+        try:
+            listings = future.result()
+        except Exception as e:
+            self.logger.error(f'Could not fetch page no. {page_no}: {e}')
+            return
+
+        if listings is None:
+            self.logger.info(f'Data not found for page no. {page_no}')
+            listings = []
+
+        listings = [item for item in listings
+                    if not self.url_visted.find(self.product_url(item))]
+
+        listings_left[url] = {'left': len(listings), 'failed': 0}
+
+        for item in listings:
+            pending[pool.submit(self.fetch_listing_data, item)] = (
+                'listing', url, item)
+
+        if not listings:
+            self._mark_page_done(listings_left, url)
+
+    def _listing_done(self, listings_left, future, page_url, json_data):
+        model = json_data.get('product_title')
+
+        page = listings_left[page_url]
+        page['left'] -= 1
+
+        try:
+            data = future.result()
+        except Exception as e:
+            self.logger.error('Could not fetch data of %s: %s', model, e)
+            page['failed'] += 1
+        else:
+            if data:
+                self.model.save(data)
+                self.listings.save(data)
+                self.url_visted.save({'link': self.product_url(json_data)})
+                self.logger.info('Saving data of %s to database...', model)
+            else:
+                self.logger.info(
+                    'Could not find data of %s.Skipping this...', model)
+
+        if page['left'] == 0:
+            self._mark_page_done(listings_left, page_url)
+
+    def _mark_page_done(self, listings_left, url):
+        """Marks the page visited if all of its listings were fetched, else
+        it is fetched again on the next run to retry the failed ones."""
+        page = listings_left.pop(url, None)
+
+        if page and page['failed']:
+            self.logger.info(
+                f'{page["failed"]} listings failed on page {url}, '
+                'it will be retried on the next run')
+            return
+
+        # listings are written before the page is marked visited, so a page
+        # is never skipped on resume with some of its listings unsaved
+        self.model.flush()
+        self.listings.flush()
+        self.url_visted.save({'link': url})
+        self.url_visted.flush()
+        self.logger.info(f'Processed page {url}')
+
 
-def start_scrapper():
-    droom_scrapper = DroomScrapper()
+def start_scrapper(concurrent=True):
+    droom_scrapper = ConcurrentDroomScrapper() if concurrent \
+        else DroomScrapper()
 
     droom_scrapper.start()
 
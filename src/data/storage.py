@@ -0,0 +1,129 @@
+from importlib.util import find_spec
+from pathlib import Path
+import pandas as pd
+from ..utils.logger import Logger
+
+
+# low cardinality text columns, stored as categories in the columnar formats
+CATEGORICAL_COLS = ['owner', 'location', 'brand']
+
+
+class CSVStorage:
+    """Plain text storage, loses the dtypes but can be opened anywhere."""
+
+    extension = '.csv'
+
+    columnar = False
+
+    def save(self, df, path):
+        df.to_csv(str(path), index=False)
+
+    def load(self, path, columns=None):
+        return pd.read_csv(str(path), usecols=columns)
+
+
+class ParquetStorage:
+    """Compressed columnar storage, needs pyarrow."""
+
+    extension = '.parquet'
+
+    columnar = True
+
+    def save(self, df, path):
+        df.to_parquet(str(path), index=False)
+
+    def load(self, path, columns=None):
+        return pd.read_parquet(str(path), columns=columns)
+
+
+class FeatherStorage:
+    """Uncompressed arrow storage, fastest to load, needs pyarrow."""
+
+    extension = '.feather'
+
+    columnar = True
+
+    def save(self, df, path):
+        df.reset_index(drop=True).to_feather(str(path))
+
+    def load(self, path, columns=None):
+        return pd.read_feather(str(path), columns=columns)
+
+
+STORAGES = {
+    'csv': CSVStorage,
+    'parquet': ParquetStorage,
+    'feather': FeatherStorage,
+}
+
+DEFAULT_FORMAT = 'parquet' if find_spec('pyarrow') else 'csv'
+
+
+class DatasetStore:
+    """
+    Saves & loads the datasets generated by each stage of the pipeline.
+
+    Params:
+    fmt (str): storage format, one of `STORAGES`. Defaults to parquet if
+    pyarrow is installed otherwise csv.
+    data_dir (str): directory where the datasets are stored.
+    """
+
+    def __init__(self, fmt=None, data_dir='data/processed'):
+        self.logger = Logger(__name__, __name__ == '__main__')
+
+        self.fmt = DEFAULT_FORMAT if fmt is None else fmt
+
+        if self.fmt not in STORAGES:
+            raise ValueError(
+                f"{self.fmt}: This storage format does not exist!")
+
+        if STORAGES[self.fmt].columnar and not find_spec('pyarrow'):
+            raise ImportError(
+                f'pyarrow is required to use {self.fmt} storage format.')
+
+        self.storage = STORAGES[self.fmt]()
+        self.data_dir = Path(data_dir)
+
+    def path(self, name):
+        return self.data_dir / f'{name}{self.storage.extension}'
+
+    def exists(self, name):
+        return self.path(name).exists()
+
+    def save(self, df, name):
+        path = self.path(name)
+
+        if self.storage.columnar:
+            df = self._typed(df)
+
+        self.storage.save(df, path)
+        self.logger.info(f'Saved {name} dataset at {path}')
+
+        return path
+
+    def load(self, name, columns=None):
+        """Loads the dataset, only the given `columns` are read if passed."""
+        path = self.path(name)
+
+        if not path.exists():
+            err = f'Dataset file does not exist {path}'
+            self.logger.error(err)
+            raise FileNotFoundError(err)
+
+        return self.storage.load(path, columns=columns)
+
+    def export_csv(self, name, path=None):
+        """Writes the dataset as csv, next to the stored file by default."""
+        path = Path(path) if path else self.data_dir / f'{name}.csv'
+
+        self.load(name).to_csv(str(path), index=False)
+        self.logger.info(f'Exported {name} dataset at {path}')
+
+        return path
+
+    def _typed(self, df):
+        cols = [col for col in CATEGORICAL_COLS
+                if col in df.columns and df[col].dtype == 'object']
+
+        return df.astype({col: 'category' for col in cols})
@@ -0,0 +1,63 @@
+import math
+
+
+class BloomFilter:
+    """
+    Memory efficient set of strings which can give false positives.
+
+    `item in bloom` is always True for added items & False for most of the
+    others, about `error_rate` of them are reported as present by mistake.
+
+    Positions come from python's `hash`, which changes between processes,
+    so the filter can't be saved & has to be built in the process using it.
+
+    Params:
+    capacity (int): number of items the filter is sized for.
+    error_rate (float): false positive rate when the filter is full.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        self.num_bits = math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(
+            self.num_bits / capacity * math.log(2)))
+
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, item):
+        h1, h2 = self._hashes(item)
+        bits, num_bits = self._bits, self.num_bits
+
+        # most missing items are rejected after the first couple of bits
+        for i in range(self.num_hashes):
+            pos = (h1 + i * h2) % num_bits
+
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+
+        return True
+
+    def add(self, item):
+        h1, h2 = self._hashes(item)
+
+        for i in range(self.num_hashes):
+            pos = (h1 + i * h2) % self.num_bits
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+        self._count += 1
+
+    def is_full(self):
+        return self._count >= self.capacity
+
+    @staticmethod
+    def _hashes(item):
+        # double hashing, the two 32 bit halves of the hash give all positions
+        h = hash(item) & 0xFFFFFFFFFFFFFFFF
+        return h & 0xFFFFFFFF, (h >> 32) | 1
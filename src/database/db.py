@@ -1,28 +1,99 @@
 import sqlite3
 
 
+JOURNAL_MODES = ['DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF']
+
+SYNCHRONOUS_MODES = ['OFF', 'NORMAL', 'FULL', 'EXTRA']
+
 
 class DB:
+    """
+    Sqlite database connection with optional buffered writes.
+
+    Params:
+    batch_size (int): rows buffered by `insert` before they are written in a
+    single transaction with `executemany`. 1 commits every row right away.
+    journal_mode (str): sqlite journal mode e.g WAL, one of `JOURNAL_MODES`.
+    synchronous (str): sqlite synchronous setting, one of `SYNCHRONOUS_MODES`.
+    cache_size (int): sqlite page cache size, negative values are in KiB.
+    """
 
     DB_NAME = 'local.db'
 
-    def __init__(self):
+    def __init__(self, batch_size=1, journal_mode=None, synchronous=None,
+                 cache_size=None):
         self.con = sqlite3.connect(self.DB_NAME)
         self.cursor = self.con.cursor()
 
+        self.batch_size = batch_size
+        self._pending = {}
+        self._pending_rows = 0
+
+        self._set_pragmas(journal_mode, synchronous, cache_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def insert(self, query, data=None):
+        if self.batch_size <= 1:
+            self.cursor.execute(query, data)
+            self.con.commit()
+            return
+
+        self._pending.setdefault(query, []).append(data)
+        self._pending_rows += 1
 
-    def insert(self,query,data=None):
-        self.cursor.execute(query,data)
-        self.con.commit()
-        
+        if self._pending_rows >= self.batch_size:
+            self.flush()
 
-    def find_all(self,query,params=()):
-        self.cursor.execute(query,params)
+    def insert_many(self, query, rows):
+        """Inserts all the rows in a single transaction."""
+        with self.con:
+            self.cursor.executemany(query, rows)
+
+    def flush(self):
+        """Writes the rows buffered by `insert`."""
+        if not self._pending:
+            return
+
+        with self.con:
+            for query, rows in self._pending.items():
+                self.cursor.executemany(query, rows)
+
+        self._pending = {}
+        self._pending_rows = 0
+
+    def close(self):
+        self.flush()
+        self.con.close()
+
+    def exists(self):
+        """True if the table of the model has any row, without reading it."""
+        self.flush()
+        self.cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {self.TABLE_NAME} LIMIT 1)')
+        return bool(self.cursor.fetchone()[0])
+
+    def find_all(self, query, params=()):
+        self.flush()
+        self.cursor.execute(query, params)
         return self.cursor.fetchall()
 
-    
+    def _set_pragmas(self, journal_mode, synchronous, cache_size):
+        if journal_mode:
+            if journal_mode.upper() not in JOURNAL_MODES:
+                raise ValueError(f'{journal_mode}: Invalid journal mode!')
+
+            self.cursor.execute(f'PRAGMA journal_mode={journal_mode}')
 
-    
+        if synchronous:
+            if synchronous.upper() not in SYNCHRONOUS_MODES:
+                raise ValueError(f'{synchronous}: Invalid synchronous mode!')
 
+            self.cursor.execute(f'PRAGMA synchronous={synchronous}')
 
-    
\ No newline at end of file
+        if cache_size is not None:
+            self.cursor.execute(f'PRAGMA cache_size={int(cache_size)}')
@@ -0,0 +1,61 @@
+import time
+
+import click
+import pandas as pd
+
+from ..utils.logger import Logger
+from .models import BikeModel, BikeListingModel
+
+logger = Logger(__name__, std_out=True)
+
+
+def migrate_bikes(chunk_size=50_000):
+    """
+    Copies the text rows of the `bikes` table into the typed `bike_listings`
+    table, cleaning them on the way.
+
+    Rows are keyed by their listing alias, so listings the scrapper saved
+    in both tables are not duplicated. The old rows have no alias, they are
+    keyed by a hash of their values so running the migration again doesn't
+    duplicate them.
+
+    Params:
+    chunk_size (int): rows read, cleaned & written at once.
+
+    Returns the number of rows migrated.
+    """
+    source = BikeModel()
+    target = BikeListingModel(journal_mode='WAL', synchronous='NORMAL')
+
+    total_rows = 0
+    start = time.perf_counter()
+
+    chunks = pd.read_sql_query(
+        f'select * from {source.TABLE_NAME}', source.con,
+        chunksize=chunk_size)
+
+    for chunk in chunks:
+        target.save_many(chunk.to_dict('records'))
+        total_rows += len(chunk)
+
+        logger.info(f'Migrated {total_rows} rows')
+
+    source.close()
+    target.close()
+
+    logger.info(
+        f'Migrated {total_rows} rows into {target.TABLE_NAME} '
+        f'in {time.perf_counter() - start:.2f}s')
+
+    return total_rows
+
+
+@click.command()
+@click.option('--chunk-size', default=50_000, help='Rows migrated at once.')
+def main(chunk_size):
+    """Migrates the scrapped bikes into the typed listings table."""
+    migrate_bikes(chunk_size)
+
+
+if __name__ == '__main__':
+    main()
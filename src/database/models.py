@@ -1,43 +1,294 @@
+import time
+import pandas as pd
 from .db import DB
+from .bloom import BloomFilter
+from ..data.preprocessing import clean_listings
 
 
 class BikeModel(DB):
 
     TABLE_NAME = 'bikes'
 
-    def __init__(self):
-        super().__init__()
+    # columns written to data/raw/data.csv
+    EXPORT_COLUMNS = ['model_name', 'model_year', 'kms_driven', 'owner',
+                      'location', 'mileage', 'power', 'price']
+
+    # droom listing alias, the key of the listing in `bike_listings`
+    COLUMNS = EXPORT_COLUMNS + ['listing_id']
+
+    DTYPES = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         self.cursor.execute(
-            "CREATE TABLE IF NOT EXISTS bikes (model_name TEXT, model_year VARCHAR(4), kms_driven VARCHAR(20), owner VARCHAR(10), location VARCHAR(60), mileage VARCHAR(20), power VARCHAR(20) ,price VARCHAR(20))")
+            f"CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} ("
+            "model_name TEXT, model_year VARCHAR(4), kms_driven VARCHAR(20), "
+            "owner VARCHAR(10), location VARCHAR(60), mileage VARCHAR(20), "
+            "power VARCHAR(20), price VARCHAR(20), listing_id TEXT)")
+
+        # tables made before the alias was stored
+        columns = [row[1] for row in self.cursor.execute(
+            f"PRAGMA table_info({self.TABLE_NAME})")]
+
+        if 'listing_id' not in columns:
+            self.cursor.execute(
+                f"ALTER TABLE {self.TABLE_NAME} ADD COLUMN listing_id TEXT")
 
         self.con.commit()
 
     def save(self, data):
-        self.insert(
-            f"INSERT INTO {self.TABLE_NAME} VALUES (:model_name,:model_year,:kms_driven,:owner,:location,:mileage,:power,:price)", data)
+        self.insert(self._insert_query(), self._with_id(data))
+
+    def save_many(self, rows):
+        self.insert_many(self._insert_query(),
+                         [self._with_id(row) for row in rows])
+
+    def all(self, **kwargs):
+        return self.find_all(f"select * from {self.TABLE_NAME}")
+
+    def _insert_query(self):
+        return (f"INSERT INTO {self.TABLE_NAME} ({','.join(self.COLUMNS)}) "
+                f"VALUES ({','.join(':' + col for col in self.COLUMNS)})")
+
+    @staticmethod
+    def _with_id(data):
+        # rows scrapped without an alias
+        return {'listing_id': None, **data}
+
+
+class BikeListingModel(DB):
+    """
+    Cleaned bike listings with typed columns.
+
+    Rows are cleaned the same way as `Preprocessor` before they are saved,
+    so numbers are stored as INTEGER/REAL & can be range queried. Listings
+    are keyed by their droom listing alias, saving a listing again replaces
+    it. Rows given to `save` are cleaned & written in batches of
+    `batch_size`.
+    """
+
+    TABLE_NAME = 'bike_listings'
+
+    COLUMNS = ['listing_id', 'model_name', 'model_year', 'kms_driven',
+               'owner', 'location', 'mileage', 'power', 'price']
+
+    # same columns as the raw `bikes` table
+    EXPORT_COLUMNS = BikeModel.EXPORT_COLUMNS
+
+    # dtypes used to read the table with pandas
+    DTYPES = {
+        'model_year': 'Int64',
+        'kms_driven': 'Int64',
+        'mileage': 'float64',
+        'power': 'float64',
+        'price': 'Int64',
+    }
+
+    TEXT_COLUMNS = ['model_name', 'owner', 'location']
+
+    INDEXED_COLUMNS = ['model_year', 'location', 'price']
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._raw_rows = []
+
+        self.cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} ("
+            "listing_id TEXT PRIMARY KEY, model_name TEXT, "
+            "model_year INTEGER, kms_driven INTEGER, owner TEXT, "
+            "location TEXT, mileage REAL, power REAL, price INTEGER)")
+
+        for col in self.INDEXED_COLUMNS:
+            self.cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.TABLE_NAME}_{col}_idx "
+                f"ON {self.TABLE_NAME} ({col})")
+
+        self.con.commit()
+
+    def save(self, data):
+        self._raw_rows.append(data)
+
+        if len(self._raw_rows) >= self.batch_size:
+            self.flush()
+
+    def save_many(self, rows):
+        """Cleans the raw rows & saves them in a single transaction."""
+        placeholders = ','.join('?' * len(self.COLUMNS))
+
+        self.insert_many(
+            f"INSERT OR REPLACE INTO {self.TABLE_NAME} "
+            f"({','.join(self.COLUMNS)}) VALUES ({placeholders})",
+            self.clean(rows))
+
+    def flush(self):
+        if self._raw_rows:
+            rows, self._raw_rows = self._raw_rows, []
+            self.save_many(rows)
+
+        super().flush()
 
     def all(self, **kwargs):
         return self.find_all(f"select * from {self.TABLE_NAME}")
 
+    def clean(self, rows):
+        """Cleans raw listing dicts into tuples of `COLUMNS`."""
+        df = pd.DataFrame(list(rows))
+
+        if 'listing_id' not in df:
+            df['listing_id'] = None
+
+        # rows without an alias (older scrapped rows) are keyed by their
+        # content, so exact duplicates are saved only once
+        missing_id = df['listing_id'].isna()
+
+        if missing_id.any():
+            hashes = pd.util.hash_pandas_object(
+                df.loc[missing_id].drop(columns='listing_id').astype(str),
+                index=False)
+            df.loc[missing_id, 'listing_id'] = \
+                'legacy-' + hashes.map('{:016x}'.format)
+
+        # the api can give numbers for text fields e.g number_of_owners
+        for col in self.TEXT_COLUMNS:
+            if col in df:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+
+        df = clean_listings(df)
+        df['model_year'] = pd.to_numeric(df['model_year'], errors='coerce')
+
+        df = df[self.COLUMNS]
+        df = df.astype(object).where(df.notna(), None)
+
+        return list(df.itertuples(index=False, name=None))
+
 
 class UrlVisited(DB):
+    """
+    Links which are already scrapped.
+
+    A bloom filter of all the links is kept in memory, so most lookups of
+    links which are not visited yet never touch the database. Only links the
+    filter reports as present are looked up using the unique index.
+
+    Params:
+    bloom_capacity (int): links the filter is sized for, it is rebuilt with
+    double the size when it gets full.
+    """
 
     TABLE_NAME = 'visted'
 
-    def __init__(self):
-        super().__init__()
+    INDEX_NAME = 'visted_link_idx'
+
+    def __init__(self, bloom_capacity=1_000_000, **kwargs):
+        super().__init__(**kwargs)
         self.cursor.execute(
             f"CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} (link TEXT)")
 
+        self._create_index()
         self.con.commit()
 
+        self.stats = LookupStats()
+        self._warm_filter(bloom_capacity)
+
     def save(self, data):
         self.insert(
-            f"INSERT INTO {self.TABLE_NAME} VALUES (:link)", data)
+            f"INSERT OR IGNORE INTO {self.TABLE_NAME} VALUES (:link)", data)
+        self._add_to_filter(data['link'])
+
+    def save_many(self, rows):
+        self.insert_many(
+            f"INSERT OR IGNORE INTO {self.TABLE_NAME} VALUES (:link)", rows)
+
+        for row in rows:
+            self._add_to_filter(row['link'])
 
     def all(self, **kwargs):
         return self.find_all(f"select * from {self.TABLE_NAME}")
 
     def find(self,link):
+        start = time.perf_counter()
+
+        if link not in self._filter:
+            self.stats.record(time.perf_counter() - start, in_memory=True)
+            return None
+
+        self.flush()
         self.cursor.execute(f"SELECT * FROM {self.TABLE_NAME} WHERE link=:link",{'link':link})
-        return self.cursor.fetchone()
+        row = self.cursor.fetchone()
+
+        self.stats.record(time.perf_counter() - start, in_memory=False,
+                          false_positive=row is None)
+        return row
+
+    def _create_index(self):
+        exists = self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name=?",
+            (self.INDEX_NAME,)).fetchone()
+
+        if exists:
+            return
+
+        # older databases can have the same link saved more than once
+        self.cursor.execute(
+            f"DELETE FROM {self.TABLE_NAME} WHERE rowid NOT IN "
+            f"(SELECT MIN(rowid) FROM {self.TABLE_NAME} GROUP BY link)")
+        self.cursor.execute(
+            f"CREATE UNIQUE INDEX {self.INDEX_NAME} "
+            f"ON {self.TABLE_NAME} (link)")
+
+    def _warm_filter(self, capacity):
+        self.flush()
+
+        count = self.cursor.execute(
+            f"SELECT COUNT(*) FROM {self.TABLE_NAME}").fetchone()[0]
+
+        self._filter = BloomFilter(max(capacity, 2 * count))
+
+        for (link,) in self.con.execute(f"SELECT link FROM {self.TABLE_NAME}"):
+            self._filter.add(link)
+
+    def _add_to_filter(self, link):
+        if self._filter.is_full():
+            self._warm_filter(2 * self._filter.capacity)
+
+        self._filter.add(link)
+
+
+class LookupStats:
+    """Latency & false positive rate of `UrlVisited.find`."""
+
+    def __init__(self):
+        self.memory_lookups = 0
+        self.db_lookups = 0
+        self.false_positives = 0
+        self.memory_time = 0.0
+        self.db_time = 0.0
+
+    def record(self, elapsed, in_memory, false_positive=False):
+        if in_memory:
+            self.memory_lookups += 1
+            self.memory_time += elapsed
+        else:
+            self.db_lookups += 1
+            self.db_time += elapsed
+            self.false_positives += false_positive
+
+    def summary(self):
+        lookups = self.memory_lookups + self.db_lookups
+        # every link reported missing by the filter is a true negative
+        negatives = self.memory_lookups + self.false_positives
+
+        return {
+            'lookups': lookups,
+            'answered_in_memory': self.memory_lookups,
+            'db_lookups': self.db_lookups,
+            'false_positives': self.false_positives,
+            'false_positive_rate': (
+                self.false_positives / negatives if negatives else 0.0),
+            'avg_memory_lookup_us': (
+                self.memory_time / self.memory_lookups * 1e6
+                if self.memory_lookups else None),
+            'avg_db_lookup_us': (
+                self.db_time / self.db_lookups * 1e6
+                if self.db_lookups else None),
+        }
@@ -2,52 +2,310 @@
 from pathlib import Path
 import pandas as pd
 from ..utils.logger import Logger
+from ..utils.profiling import profiled
+from ..data.storage import DatasetStore
+from datetime import date
+from functools import lru_cache
+import json
 import re
 import numpy as np
 
 
+ENGINE_RE = re.compile(r"(\d{2,})cc")
+
+MODEL_YEAR_RE = re.compile(r"\b((?:19|20)\d{2})\b")
+
+# number of distinct model names kept by `parse_model_name`
+PARSE_CACHE_SIZE = 100_000
+
+PARSED_COLS = ['brand', 'engine', 'model_year']
+
+
+def normalize_model_name(model_name):
+    return ' '.join(str(model_name).split())
+
+
+def parse_model_name(model_name):
+    """
+    Brand, engine cc & model year of a listing title, e.g
+    'Bajaj Avenger 220cc 2017' gives ('Bajaj', 220.0, 2017). Missing engine
+    or year are NaN.
+
+    Titles repeat a lot, results are cached on the whitespace normalized
+    title, see `parse_cache_info`.
+    """
+    return _parse_normalized(normalize_model_name(model_name))
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_normalized(model_name):
+    brand = model_name.split(' ', 1)[0]
+
+    engine = ENGINE_RE.search(model_name)
+    years = MODEL_YEAR_RE.findall(model_name)
+
+    return (brand,
+            float(engine.group(1)) if engine else np.nan,
+            int(years[-1]) if years else np.nan)
+
+
+def parse_cache_info():
+    """Hits, misses & hit rate of the `parse_model_name` cache."""
+    info = _parse_normalized.cache_info()
+    lookups = info.hits + info.misses
+
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_rate': info.hits / lookups if lookups else None,
+    }
+
+
+def clear_parse_cache():
+    _parse_normalized.cache_clear()
+
+
+def parse_model_names(model_names):
+    """
+    `parse_model_name` of a whole column as a frame of `PARSED_COLS`.
+
+    Only the distinct titles are parsed, the results are spread back to
+    every row by their factorized codes. Missing titles give NaN.
+    """
+    codes, uniques = pd.factorize(model_names)
+
+    parsed = pd.DataFrame([parse_model_name(name) for name in uniques],
+                          columns=PARSED_COLS)
+
+    # missing titles get code -1, which takes the appended empty row
+    parsed = parsed.reindex(range(len(uniques) + 1))
+
+    return parsed.take(codes).set_index(model_names.index)
+
+
+def brand_from_model_name(model_name):
+    """First word of the model name, same as `_make_brand_feature`."""
+    return parse_model_names(model_name)['brand'].fillna('')
+
+
+def engine_from_model_name(model_name):
+    """Engine cc mentioned in the model name e.g 150cc, NaN if missing."""
+    return parse_model_names(model_name)['engine'].astype(float)
+
+
+def age_from_model_year(model_year, current_year):
+    """Age of the bike in years, NaN where the model year is 0 or missing."""
+    return (current_year - model_year).where(model_year != 0)
+
+
+def bucket_categories(values, keep, other='other'):
+    """Keeps the values found in `keep` & replaces the rest with `other`."""
+    values = values.astype(object)
+    return values.where(values.isin(keep), other)
+
+
+def to_categorical(values, keep, other='other'):
+    """Categorical of the values found in `keep`, the rest & missing values
+    become `other`."""
+    categories = list(dict.fromkeys([*keep, other]))
+
+    return pd.Categorical(bucket_categories(values, keep, other),
+                          categories=categories)
+
+
+def top_values(values, top_n):
+    """The `top_n` most frequent values, most frequent first."""
+    return values.value_counts().index[:top_n].tolist()
+
+
+def vocabulary_path(model_path):
+    """Vocabulary file saved next to a model pickle."""
+    return Path(model_path).with_suffix('.vocab.json')
+
+
+class FeatureVocabulary:
+    """
+    Brands, locations & reference year learnt from the training data.
+
+    Once fit the features of any number of listings can be made without
+    the training data, every row is just a lookup in the vocabulary.
+
+    Params:
+    brands (list): brands kept as categories, others become 'other'.
+    locations (list): locations kept as categories, others become 'other'.
+    reference_year (int): year the age of the bikes is calculated from.
+    """
+
+    other = 'other'
+
+    def __init__(self, brands, locations, reference_year):
+        self.brands = list(brands)
+        self.locations = list(locations)
+        self.reference_year = int(reference_year)
+
+    @classmethod
+    def fit(cls, df, num_brands=10, num_locations=5, reference_year=None):
+        """Learns the most frequent brands & locations of the cleaned data."""
+        return cls(
+            brands=top_values(
+                brand_from_model_name(df['model_name']), num_brands),
+            locations=top_values(df['location'], num_locations),
+            reference_year=reference_year or date.today().year)
+
+    def brand(self, model_name):
+        return to_categorical(
+            brand_from_model_name(model_name), self.brands, self.other)
+
+    def location(self, location):
+        return to_categorical(location, self.locations, self.other)
+
+    def age(self, model_year):
+        return age_from_model_year(model_year, self.reference_year)
+
+    def transform(self, df):
+        """Adds the brand, engine, age & bucketed location features."""
+        df = df.copy()
+        parsed = parse_model_names(df['model_name'])
+
+        df['brand'] = to_categorical(
+            parsed['brand'].fillna(''), self.brands, self.other)
+        df['engine'] = parsed['engine'].astype(float)
+        df['age'] = self.age(pd.to_numeric(df['model_year'], errors='coerce'))
+        df['location'] = self.location(df['location'])
+
+        return df
+
+    def to_dict(self):
+        return {
+            'brands': self.brands,
+            'locations': self.locations,
+            'reference_year': self.reference_year,
+        }
+
+    def save(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath) as f:
+            return cls(**json.load(f))
+
+
 class FeatureBuilder:
-    data_file = Path('data/processed/data.csv')
+    """
+    Builds the model features from the cleaned dataset.
+
+    The top brands, top locations & the current year are learnt by `fit`
+    into `vocabulary`, which is saved along with the models so the
+    features of new listings are made the same way.
+
+    Params:
+    vectorized (bool): build the features with pandas string methods &
+    column arithmetic instead of row-wise `apply`, brand & location are
+    made categoricals. Set False to use the old row-wise path.
+    storage (str): format of the datasets, see `DatasetStore`.
+    """
+
+    # name of the cleaned input & the generated datasets in `DatasetStore`
+    dataset = 'data'
+
+    features_dataset = 'features'
 
     target_var = 'price'
 
-    def __init__(self):
+    # brands & locations kept as categories, the rest become 'other'
+    num_brands = 10
+
+    num_locations = 5
+
+    # bump when the features made from the same data change, see `StageCache`
+    cache_version = 1
+
+    def __init__(self, vectorized=True, storage=None):
         self.logger = Logger(__name__, __name__ == '__main__')
+        self.vectorized = vectorized
+        self.vocabulary = None
+        self.store = DatasetStore(storage)
+        self.data_file = self.store.path(self.dataset)
 
+    @profiled(rows='df')
+    def load_data(self):
         if not self.data_file.exists():
             err = f'Data file does not exist {self.data_file}'
             self.logger.info(err)
             raise FileNotFoundError(err)
 
-    def load_data(self):
-        self.df = pd.read_csv(str(self.data_file))
+        self.df = self.store.load(self.dataset)
+        return self.df
+
+    @profiled(rows='df')
+    def build(self, save_file=False, df=None):
+        """Builds the features of the cleaned dataset, or of `df` if passed."""
+        self.logger.info("Starting feature building...")
+
+        if df is None:
+            self.load_data()
+        else:
+            self.df = df.copy()
+
+        self.make_features()
+        self.logger.info("Finished feature building...")
+
+        if save_file:
+            self.store.save(self.df, self.features_dataset)
+
         return self.df
 
-    def build(self):
-        self.logger.info(f"Starting feature building...")
-        self.load_data()
+    def fit(self, df):
+        """Learns the feature vocabulary from the cleaned data."""
+        self.vocabulary = FeatureVocabulary.fit(
+            df, self.num_brands, self.num_locations)
+        return self.vocabulary
+
+    @profiled(rows='df')
+    def make_features(self):
+        """Builds the features of the already loaded `self.df`, the
+        vocabulary is fit on it unless it was fit before."""
+        if self.vocabulary is None:
+            self.fit(self.df)
+
         self._make_brand_feature()
         self._make_engine_feature()
         self._make_age_feature()
         self._handle_location()
         self.clean_df()
-        self.logger.info(f"Finished feature building...")
+
         return self.df
 
+    @profiled(rows='df')
     def _make_brand_feature(self):
         """There are too many models, let try to create a brand category using the first word of the model name."""
         self.logger.info(f"Making new brand feature.")
+
+        if self.vectorized:
+            self.df['brand'] = self.vocabulary.brand(self.df['model_name'])
+            return
+
         self.df['brand'] = self.df['model_name'].apply(
             lambda x: ' '.join(x.split()[:1]))
 
         # Let's take only top 10 brands as our base brand & make other as 'other' category
-        top_brands = self.df['brand'].value_counts().index[:10]
+        top_brands = self.df['brand'].value_counts().index[:self.num_brands]
         self.df['brand'] = self.df['brand'].apply(
             lambda x: x if x in top_brands else 'other')
 
+    @profiled(rows='df')
     def _make_engine_feature(self):
         """Model name contains the engine details e.g 150cc,Make new feature using the info as engine."""
         self.logger.info(f"Making new engine feature.")
+
+        if self.vectorized:
+            self.df['engine'] = engine_from_model_name(self.df['model_name'])
+            return
+
         def extract_cc(val):
             match = re.search(r"\d{2,}(cc)", val)
             if match:
@@ -57,23 +315,36 @@ class FeatureBuilder:
 
         self.df['engine'] = self.df['model_name'].apply(extract_cc)
 
+    @profiled(rows='df')
     def _make_age_feature(self):
         """We can use model_year to calculate the age of the bike, Age might give us the better results or representation."""
         self.logger.info(f"Making new age feature.")
-        from datetime import date
+        if self.vectorized:
+            self.df['age'] = self.vocabulary.age(self.df['model_year'])
+            return
+
         current_year = date.today().year
 
         self.df['age'] = self.df.model_year.apply(
             lambda x: current_year - x if x else None)
 
+    @profiled(rows='df')
     def _handle_location(self):
         """Convert all the values into top 5 categories and make other as 'others'"""
         self.logger.info(f"Creating top 5 location categories out of all locations.")
-        top_locations = self.df.location.value_counts().index[:5]
 
-        self.df['location'] = self.df.location.apply(
+        if self.vectorized:
+            self.df['location'] = self.vocabulary.location(self.df['location'])
+            return
+
+        top_locations = self.df.location.value_counts().index[
+            :self.num_locations]
+
+        # categories map only non missing values, NaN has to become 'other' too
+        self.df['location'] = self.df.location.astype(object).apply(
             lambda x: x if x in top_locations else 'other')
 
+    @profiled(rows='df')
     def clean_df(self):
         drop_cols = ['model_name', 'model_year']
         self.logger.info(f"Dropping {drop_cols} columns.")
@@ -1,52 +1,165 @@
 from pathlib import Path
+import json
 import pandas as pd
 from pandas.core.frame import DataFrame
 from ..utils.logger import Logger
+from ..utils.profiling import profiled
+
+
+class OutlierRule:
+    """
+    Allowed range of a column, from quantiles of the training data or fixed
+    values. Rows outside the range or with the value missing are outliers.
+
+    Params:
+    column (str): column the rule is checked on.
+    lower_quantile (float): values below this quantile are outliers.
+    upper_quantile (float): values above this quantile are outliers.
+    min_value (float): fixed lower limit, used if there is no lower quantile.
+    max_value (float): fixed upper limit, used if there is no upper quantile.
+    """
+
+    def __init__(self, column, lower_quantile=None, upper_quantile=None,
+                 min_value=None, max_value=None):
+        self.column = column
+        self.lower_quantile = lower_quantile
+        self.upper_quantile = upper_quantile
+        self.min_value = min_value
+        self.max_value = max_value
+
+    @property
+    def quantiles(self):
+        return [q for q in (self.lower_quantile, self.upper_quantile)
+                if q is not None]
+
+    def __repr__(self):
+        return (f'OutlierRule({self.column!r}, {self.lower_quantile}, '
+                f'{self.upper_quantile}, {self.min_value}, {self.max_value})')
+
+
+DEFAULT_RULES = [
+    OutlierRule('kms_driven', lower_quantile=.1, upper_quantile=.99),
+    OutlierRule('price', lower_quantile=.1, upper_quantile=.99),
+    # remove bikes which has age more than 15 yrs
+    OutlierRule('age', max_value=16),
+]
 
 
 class Outliers:
+    """
+    Removes the rows breaking any of the outlier rules.
 
-    def __init__(self,df: DataFrame):
+    `fit` computes the quantiles of all the rules in one go into
+    `thresholds`, `transform` filters a frame with a single mask. The
+    thresholds can be saved & loaded, so new batches are filtered with the
+    same cut-offs as the training data.
+
+    Params:
+    df (DataFrame): data used by `detect`.
+    rules (list): `OutlierRule`s to apply, defaults to `DEFAULT_RULES`.
+    """
+
+    # bump when the rows kept from the same data change, see `StageCache`
+    cache_version = 1
+
+    def __init__(self, df: DataFrame = None, rules=None):
         self.logger = Logger(__name__, __name__ == '__main__')
         self.df = df
-    
+        self.rules = rules or DEFAULT_RULES
+        self.thresholds = None
 
+    @profiled()
     def detect(self):
-        self.logger.info(f"Started outlier detection.")
+        self.logger.info("Started outlier detection.")
         self.logger.info(f"Dataset shape before outlier removal : {self.df.shape}")
-        num_cols = ['kms_driven','price']
 
-        for col in num_cols:
+        self.fit(self.df)
+        self.df = self.transform(self.df)
 
-            max_val = self.df[col].quantile(.99)
+        self.logger.info(f"Dataset shape after outlier removal : {self.df.shape}")
 
-            min_val = self.df[col].quantile(.1)
+        self.logger.info("Finished outlier detection.")
 
-            self.logger.info(f"Min/Max Range for {col} is {min_val} / {max_val}")
+        return self.df
 
-            total_outs = self.df[~(self.df[col] <= max_val)].shape[0]
+    def fit(self, df: DataFrame):
+        """Computes the (min, max) range of every rule column."""
+        quantiles = sorted({q for rule in self.rules for q in rule.quantiles})
+        quantile_cols = list(dict.fromkeys(
+            rule.column for rule in self.rules if rule.quantiles))
 
-            self.logger.info(f"Total outliers detected for {col} is {total_outs}")
+        values = df[quantile_cols].quantile(quantiles) if quantiles else None
 
-            self.df = self.df[(self.df[col] <= max_val)]
+        self.thresholds = {}
 
-            self.logger.info(f"Outliers removed for {col} based on min/max quantile of (.1, .99).")
+        for rule in self.rules:
+            min_val, max_val = rule.min_value, rule.max_value
 
-        # remove bikes which has age more than 15 yrs
-        self.df = self.df[self.df['age'] <= 16]
+            if rule.lower_quantile is not None:
+                min_val = values.at[rule.lower_quantile, rule.column]
 
-        self.logger.info(f"Dataset shape after outlier removal : {self.df.shape}")
+            if rule.upper_quantile is not None:
+                max_val = values.at[rule.upper_quantile, rule.column]
 
-        self.logger.info(f"Finished outlier detection.")
+            self.logger.info(
+                f"Min/Max Range for {rule.column} is {min_val} / {max_val}")
 
-        return self.df
+            self.thresholds[rule.column] = (
+                None if pd.isna(min_val) else float(min_val),
+                None if pd.isna(max_val) else float(max_val))
 
+        return self.thresholds
+
+    def transform(self, df: DataFrame):
+        """Filters the rows outside the fitted thresholds in one go."""
+        if self.thresholds is None:
+            raise ValueError('Outlier thresholds are not fit. Call fit first.')
+
+        keep = pd.Series(True, index=df.index)
+
+        for col, (min_val, max_val) in self.thresholds.items():
+            # missing values fail the comparisons & are removed as well
+            in_range = df[col].notna()
+
+            if min_val is not None:
+                in_range &= df[col] >= min_val
+
+            if max_val is not None:
+                in_range &= df[col] <= max_val
+
+            self.logger.info(
+                f"Total outliers detected for {col} is {(~in_range).sum()}")
+
+            keep &= in_range
+
+        return df[keep]
+
+    def save(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump(self.thresholds, f, indent=2)
+
+        self.logger.info(f'Outlier thresholds saved at {filepath}')
+
+    @classmethod
+    def load(cls, filepath):
+        """Outliers with the thresholds saved by `save`, ready to transform."""
+        with open(filepath) as f:
+            return cls.from_thresholds(json.load(f))
+
+    @classmethod
+    def from_thresholds(cls, thresholds):
+        """Outliers with already fitted thresholds, ready to transform."""
+        outliers = cls()
+        outliers.thresholds = {col: tuple(limits)
+                               for col, limits in thresholds.items()}
+
+        return outliers
 
     def _get_num_features(self):
         return self.df.select_dtypes(exclude='object').columns
 
 
 if __name__ == '__main__':
-    Outliers('data/processed/data.csv').detect()
-
+    from ..features.build_features import FeatureBuilder
 
+    Outliers(FeatureBuilder().build()).detect()
@@ -0,0 +1,194 @@
+from datetime import datetime
+from pathlib import Path
+import json
+import platform
+import shutil
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+
+from ..utils.logger import Logger
+
+
+ARTIFACT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+
+PIPELINE_FILE = 'pipeline.joblib'
+
+
+def versions():
+    return {
+        'python': platform.python_version(),
+        'sklearn': sklearn.__version__,
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'joblib': joblib.__version__,
+    }
+
+
+def save_artifact(pipe, directory, features, **metadata):
+    """
+    Saves a trained pipeline as an artifact directory,
+
+        manifest.json     format version, library versions, feature schema
+        pipeline.joblib   the pipeline, numpy arrays stored unpickled so
+                          they can be memory mapped by `load_artifact`
+
+    Params:
+    pipe (Pipeline): trained pipeline.
+    directory (str): artifact directory, created if missing.
+    features (DataFrame): model input, its columns & dtypes are the schema.
+    metadata: anything else to keep in the manifest e.g log_target.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # not compressed, compressed arrays can't be memory mapped
+    joblib.dump(pipe, directory / PIPELINE_FILE)
+
+    manifest = {
+        'artifact_version': ARTIFACT_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'estimator': type(pipe.named_steps['estimator']).__name__,
+        'features': [{'name': col, 'dtype': str(dtype)}
+                     for col, dtype in features.dtypes.items()],
+        'versions': versions(),
+        **metadata,
+    }
+
+    with open(directory / MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return directory
+
+
+def save_extra(directory, name, obj):
+    """
+    Saves `obj` with joblib in the artifact directory, next to the pipeline,
+    e.g what the incremental training keeps of a model.
+    """
+    path = Path(directory) / name
+    tmp_path = path.with_suffix('.tmp')
+
+    joblib.dump(obj, tmp_path)
+    tmp_path.replace(path)
+
+
+def load_extra(directory, name):
+    """Object saved by `save_extra`, None if there's none."""
+    path = Path(directory) / name
+    return joblib.load(path) if path.exists() else None
+
+
+def replace_artifact(pipe, directory, features, extras=None, **metadata):
+    """
+    Saves the artifact to a new directory & swaps it in place of the old
+    one. Processes which memory mapped the old files keep reading them, the
+    files are only unlinked.
+
+    Params:
+    extras (dict): objects saved with `save_extra` along with the pipeline.
+    """
+    directory = Path(directory)
+    new_dir = directory.with_name(directory.name + '.new')
+    old_dir = directory.with_name(directory.name + '.old')
+
+    shutil.rmtree(new_dir, ignore_errors=True)
+    save_artifact(pipe, new_dir, features, **metadata)
+
+    for name, obj in (extras or {}).items():
+        save_extra(new_dir, name, obj)
+
+    if directory.exists():
+        shutil.rmtree(old_dir, ignore_errors=True)
+        directory.rename(old_dir)
+
+    new_dir.rename(directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    return directory
+
+
+def read_manifest(directory):
+    path = Path(directory) / MANIFEST_FILE
+
+    if not path.exists():
+        raise FileNotFoundError(f'Artifact manifest does not exist {path}')
+
+    with open(path) as f:
+        manifest = json.load(f)
+
+    if manifest['artifact_version'] > ARTIFACT_VERSION:
+        raise ValueError(
+            f'{path}: artifact version {manifest["artifact_version"]} is '
+            f'newer than the supported version {ARTIFACT_VERSION}')
+
+    return manifest
+
+
+def is_artifact(path):
+    return (Path(path) / MANIFEST_FILE).exists()
+
+
+def load_artifact(directory, mmap_mode='r'):
+    """Loads the pipeline, its arrays are memory mapped read only by
+    default so processes loading the same artifact share the pages."""
+    return joblib.load(Path(directory) / PIPELINE_FILE, mmap_mode=mmap_mode)
+
+
+class LazyPipeline:
+    """
+    Stands in for the pipeline of an artifact & loads it on first use.
+
+    Only the manifest is read up front, so starting a server with many
+    models is quick & models which never get a request take no memory.
+
+    Params:
+    directory (str): artifact directory written by `save_artifact`.
+    mmap_mode (str): passed to `load_artifact`, None loads into memory.
+    """
+
+    def __init__(self, directory, mmap_mode='r'):
+        self.logger = Logger(__name__, __name__ == '__main__')
+        self.directory = Path(directory)
+        self.mmap_mode = mmap_mode
+        self.manifest = read_manifest(self.directory)
+
+        self._pipe = None
+        self._lock = threading.Lock()
+
+        saved_with = self.manifest['versions']['sklearn']
+
+        if saved_with != sklearn.__version__:
+            self.logger.info(
+                f'{self.directory} was saved with sklearn {saved_with}, '
+                f'running {sklearn.__version__}')
+
+    @property
+    def loaded(self):
+        return self._pipe is not None
+
+    @property
+    def pipe(self):
+        if self._pipe is None:
+            with self._lock:
+                if self._pipe is None:
+                    self._pipe = load_artifact(self.directory, self.mmap_mode)
+                    self.logger.info(f'Loaded model artifact {self.directory}')
+
+        return self._pipe
+
+    @property
+    def feature_names(self):
+        return [feature['name'] for feature in self.manifest['features']]
+
+    @property
+    def named_steps(self):
+        return self.pipe.named_steps
+
+    def predict(self, X):
+        return self.pipe.predict(X)
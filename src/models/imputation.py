@@ -0,0 +1,57 @@
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.impute import KNNImputer
+
+
+class FrameImputer(BaseEstimator, TransformerMixin):
+    """
+    Fills the missing numeric values, first step of the model pipelines.
+
+    The frame comes out with the same columns in the same order, so the
+    column transformer after it still finds its columns by position. The
+    imputer is fit with the pipeline & saved along with it, so new listings
+    are filled with the values learnt from the training data.
+
+    Params:
+    strategy (str): 'knn' fills from the 7 nearest rows (slow, O(n^2)),
+    'group_median' fills with the median of the rows of the same
+    `group_col`, or the overall median for unknown groups.
+    group_col (str): column grouping the rows for 'group_median'.
+    """
+
+    STRATEGIES = ['knn', 'group_median']
+
+    def __init__(self, strategy='group_median', group_col='brand'):
+        self.strategy = strategy
+        self.group_col = group_col
+
+    def fit(self, X, y=None):
+        if self.strategy not in self.STRATEGIES:
+            raise ValueError(f'{self.strategy}: Invalid imputation strategy!')
+
+        self.num_cols_ = X.select_dtypes(include='number').columns.tolist()
+
+        if self.strategy == 'knn':
+            self.knn_ = KNNImputer(n_neighbors=7, weights='distance')
+            self.knn_.fit(X[self.num_cols_])
+        else:
+            groups = X[self.group_col].astype(object)
+            self.group_medians_ = X[self.num_cols_].groupby(groups).median()
+            self.medians_ = X[self.num_cols_].median()
+
+        return self
+
+    def transform(self, X):
+        X = X.copy()
+
+        if self.strategy == 'knn':
+            X[self.num_cols_] = self.knn_.transform(X[self.num_cols_])
+            return X
+
+        groups = X[self.group_col].astype(object)
+        group_values = self.group_medians_.reindex(groups).set_axis(X.index)
+
+        X[self.num_cols_] = X[self.num_cols_] \
+            .fillna(group_values) \
+            .fillna(self.medians_)
+
+        return X
@@ -0,0 +1,649 @@
+"""
+Incremental training of the models on the listings appended to the raw
+file since they were last trained.
+
+Only the new rows are cleaned & turned into features, with the vocabulary
+& outlier thresholds of the last full training. The statistics those were
+learnt from (brand & location counts, quantiles of the outlier columns,
+range of the scaled columns) are kept up to date in `STATE_FILE`, when they
+drift too far from what the models were trained with the models have to be
+trained again on all the rows.
+
+What a model needs to learn more rows (e.g the normal equations of the
+linear regression) & the raw file offset it learnt up to are saved in its
+artifact, `INCREMENTAL_FILE`, so each model is updated in one step. A run
+stopped half way doesn't learn the same rows twice when started again.
+
+> python -m src.models.train_model --incremental
+"""
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+from ..data.cache import file_hash
+from ..data.preprocessing import Preprocessor, RowHashIndex, clean_listings
+from ..features.build_features import FeatureVocabulary, brand_from_model_name
+from ..features.outliers import DEFAULT_RULES, Outliers
+from ..utils.logger import Logger
+from ..utils.profiling import profiled, stage
+from .artifacts import is_artifact, load_artifact, load_extra, \
+    replace_artifact, save_extra
+from .metrics import Metrics
+from .model_factory import ModelFactory
+from .predict_model import FEATURE_COLS
+
+
+STATE_FILE = 'models/incremental_state.json'
+
+# saved in each model artifact, see `save_extra`
+INCREMENTAL_FILE = 'incremental.joblib'
+
+# one JSON line per incremental run
+UPDATES_LOG = 'reports/incremental_updates.jsonl'
+
+# bump when the statistics kept by `IncrementalState` change
+STATE_VERSION = 1
+
+# the models are trained again on all the rows past any of these
+DRIFT_THRESHOLDS = {
+    # rows added since the last full training, as a share of its rows
+    'max_delta_share': .5,
+    # move of an outlier quantile, relative to its saved threshold
+    'max_threshold_shift': .1,
+    # values outside the range the scalers were fit on, as a share of it
+    'max_range_excess': .1,
+    # drop of the R^2 on the new rows below the test R^2 of the report
+    'max_r2_drop': .1,
+    # the R^2 of fewer new rows than this isn't checked
+    'min_rows': 50,
+}
+
+# columns of the `MinMaxScaler` of the model pipelines
+SCALED_COLS = ['kms_driven', 'engine', 'mileage', 'power']
+
+
+def read_new_rows(data_file, start, end):
+    """Raw rows between the byte offsets `start` & `end` of the csv."""
+    columns = pd.read_csv(str(data_file), nrows=0).columns
+    dtype = {col: str for col in Preprocessor.text_cols if col in columns}
+
+    with open(data_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    if not data.strip():
+        return pd.DataFrame(columns=columns)
+
+    return pd.read_csv(BytesIO(data), header=None, names=columns, dtype=dtype)
+
+
+class QuantileSketch:
+    """
+    Quantiles of a stream of values with a bounded relative error, like
+    DDSketch. Values are counted in logarithmic buckets, so any number of
+    rows takes a few hundred counters & new batches are just added.
+
+    Only meant for positive columns like prices, values <= 0 count as 0.
+
+    Params:
+    relative_accuracy (float): most relative error of the quantiles.
+    """
+
+    def __init__(self, relative_accuracy=.01, counts=None, zeros=0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.counts = {int(key): int(n) for key, n in (counts or {}).items()}
+        self.zeros = int(zeros)
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.counts.values())
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+
+        self.zeros += int((values <= 0).sum())
+
+        # bucket k holds the values in (gamma^(k-1), gamma^k]
+        keys = np.ceil(np.log(values[values > 0]) / np.log(self.gamma))
+
+        for key, n in zip(*np.unique(keys.astype(int), return_counts=True)):
+            self.counts[int(key)] = self.counts.get(int(key), 0) + int(n)
+
+        return self
+
+    def quantile(self, q):
+        """Value of the quantile `q`, None if nothing was added."""
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zeros
+
+        if rank < seen:
+            return 0.0
+
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+
+            if rank < seen:
+                break
+
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'counts': {str(key): n for key, n in self.counts.items()},
+            'zeros': self.zeros,
+        }
+
+
+def _design(pipe, X):
+    """Input of the estimator, with a column of ones for the intercept."""
+    Z = np.asarray(pipe[:-1].transform(X), dtype=float)
+    return np.column_stack([Z, np.ones(len(Z))])
+
+
+def _init_least_squares(pipe, X, y):
+    """X'X & X'y of the rows a linear pipeline is trained on."""
+    Z = _design(pipe, X)
+    return {'xtx': Z.T @ Z, 'xty': Z.T @ np.asarray(y, dtype=float)}
+
+
+def _update_least_squares(pipe, X, y, learnt, share):
+    """The normal equations of the new rows are added & solved, which gives
+    the same coefficients as fitting all the rows again."""
+    Z = _design(pipe, X)
+
+    learnt['xtx'] = learnt['xtx'] + Z.T @ Z
+    learnt['xty'] = learnt['xty'] + Z.T @ np.asarray(y, dtype=float)
+
+    coef = np.linalg.lstsq(learnt['xtx'], learnt['xty'], rcond=None)[0]
+
+    estimator = pipe.named_steps['estimator']
+    estimator.coef_, estimator.intercept_ = coef[:-1], coef[-1]
+
+
+def _update_warm_start(pipe, X, y, learnt, share):
+    """Trees are added & fit on the new rows only, as many more trees as
+    the share of rows they add."""
+    estimator = pipe.named_steps['estimator']
+    added = max(1, math.ceil(estimator.n_estimators * share))
+
+    estimator.set_params(warm_start=True,
+                         n_estimators=estimator.n_estimators + added)
+    estimator.fit(pipe[:-1].transform(X), y)
+    estimator.set_params(warm_start=False)
+
+
+def _init_rows(pipe, X, y):
+    return {'X': X, 'y': np.asarray(y)}
+
+
+def _update_refit(pipe, X, y, learnt, share):
+    """The pipeline is fit again on the rows it was trained on & the new
+    ones, cheap for nearest neighbours which just store the rows."""
+    learnt['X'] = pd.concat([learnt['X'], X])
+    learnt['y'] = np.concatenate([learnt['y'], y])
+
+    pipe.fit(learnt['X'], learnt['y'])
+
+
+# strategies of `Model.incremental_update`, what the model keeps at the
+# full training & how it learns new rows
+UPDATERS = {
+    'least_squares': (_init_least_squares, _update_least_squares),
+    'warm_start': (None, _update_warm_start),
+    'append': (_init_rows, _update_refit),
+}
+
+
+def _target(name, df):
+    model = ModelFactory().get_model(name)
+    return np.log1p(df['price']) if model.log_target else df['price']
+
+
+class IncrementalState:
+    """
+    What the incremental training knows about the rows learnt so far.
+
+    Params:
+    raw_offset (int): bytes of the raw file already learnt, the new rows
+    start there.
+    raw_hash (str): sha256 of those bytes, to tell if the file was rewritten.
+    columns (list): columns of the cleaned rows, used to hash them.
+    vocabulary (dict): `FeatureVocabulary` of the full training.
+    brand_counts (dict): rows of each brand, before removing the outliers.
+    location_counts (dict): rows of each location, same.
+    sketches (dict): `QuantileSketch` of each column with a quantile
+    outlier rule.
+    seen (RowHashIndex): hashes of the cleaned rows, to drop duplicates.
+    rows (int): rows the models were trained on, since the full training
+    & the updates.
+    rows_added (int): rows added by the updates since the full training.
+    thresholds (dict): `Outliers` thresholds of the full training.
+    fitted_ranges (dict): (min, max) of the `SCALED_COLS` at the full
+    training.
+    ranges (dict): (min, max) of the `SCALED_COLS` of all the rows.
+    models (dict): test R^2 of each model at the full training.
+    """
+
+    def __init__(self, raw_offset, raw_hash, columns, vocabulary,
+                 brand_counts, location_counts, sketches, seen=None, rows=0,
+                 rows_added=0, thresholds=None, fitted_ranges=None,
+                 ranges=None, models=None):
+        self.raw_offset = raw_offset
+        self.raw_hash = raw_hash
+        self.columns = list(columns)
+        self.vocabulary = vocabulary
+        self.brand_counts = brand_counts
+        self.location_counts = location_counts
+        self.sketches = {col: sketch if isinstance(sketch, QuantileSketch)
+                         else QuantileSketch(**sketch)
+                         for col, sketch in sketches.items()}
+        self.seen = seen if isinstance(seen, RowHashIndex) \
+            else RowHashIndex(seen or ())
+        self.rows = rows
+        self.rows_added = rows_added
+        self.thresholds = thresholds
+        self.fitted_ranges = fitted_ranges
+        self.ranges = ranges
+        self.models = models or {}
+
+    @classmethod
+    def fit(cls, cleaned, features, vocabulary, raw_offset, raw_hash):
+        """
+        Statistics of the cleaned raw rows, `fit_outliers` adds the ones of
+        the training data.
+
+        Params:
+        cleaned (DataFrame): the cleaned raw rows, see `Preprocessor`.
+        features (DataFrame): their features, before removing the outliers.
+        vocabulary (FeatureVocabulary): vocabulary of the features.
+        raw_offset (int): size of the raw file when it was read.
+        raw_hash (str): sha256 of those bytes.
+        """
+        state = cls(
+            raw_offset=raw_offset, raw_hash=raw_hash, columns=cleaned.columns,
+            vocabulary=vocabulary.to_dict(), brand_counts={},
+            location_counts={},
+            sketches={rule.column: QuantileSketch()
+                      for rule in DEFAULT_RULES if rule.quantiles})
+
+        state.seen.add(cleaned)
+        state._add_statistics(cleaned, features)
+
+        return state
+
+    def fit_outliers(self, df, thresholds):
+        """Adds the outlier thresholds & the range of the scaled columns of
+        the outlier free training data."""
+        self.rows = len(df)
+        self.rows_added = 0
+        self.thresholds = thresholds
+        self.ranges = {col: (float(df[col].min()), float(df[col].max()))
+                       for col in SCALED_COLS}
+        self.fitted_ranges = dict(self.ranges)
+
+        return self
+
+    def add_rows(self, raw):
+        """
+        Cleans the new raw rows & updates the running statistics with them.
+
+        Returns the rows not seen before, as features without the outliers.
+        """
+        cleaned = clean_listings(raw)[self.columns]
+        cleaned = cleaned[self.seen.add(cleaned)]
+
+        features = FeatureVocabulary(**self.vocabulary).transform(cleaned)
+        self._add_statistics(cleaned, features)
+
+        df = Outliers.from_thresholds(self.thresholds).transform(features)
+        df = df[FEATURE_COLS + ['price']]
+
+        for col in SCALED_COLS:
+            if df[col].notna().any():
+                low, high = self.ranges[col]
+                self.ranges[col] = (min(low, float(df[col].min())),
+                                    max(high, float(df[col].max())))
+
+        self.rows += len(df)
+        self.rows_added += len(df)
+
+        return df
+
+    def drift(self, thresholds=DRIFT_THRESHOLDS):
+        """Reasons to train the models again on all the rows, if any."""
+        share = self.rows_added / max(self.rows - self.rows_added, 1)
+
+        reasons = [f'{share:.0%} more rows since the full training'] \
+            if share > thresholds['max_delta_share'] else []
+
+        reasons += self._vocabulary_drift()
+        reasons += self._threshold_drift(thresholds['max_threshold_shift'])
+        reasons += self._range_drift(thresholds['max_range_excess'])
+
+        return reasons
+
+    def _vocabulary_drift(self):
+        reasons = []
+
+        for kind, counts in [('brands', self.brand_counts),
+                             ('locations', self.location_counts)]:
+            kept = self.vocabulary[kind]
+            others = [n for value, n in counts.items() if value not in kept]
+            least_kept = min((counts.get(value, 0) for value in kept),
+                             default=0)
+
+            # a tie with the least frequent kept value isn't a change
+            if kept and others and max(others) > least_kept:
+                reasons.append(f'the top {len(kept)} {kind} changed')
+
+        return reasons
+
+    def _threshold_drift(self, max_shift):
+        reasons = []
+
+        for rule in DEFAULT_RULES:
+            limits = zip((rule.lower_quantile, rule.upper_quantile),
+                         self.thresholds[rule.column])
+
+            for q, threshold in limits:
+                if q is None or not threshold:
+                    continue
+
+                value = self.sketches[rule.column].quantile(q)
+                shift = abs(value - threshold) / abs(threshold)
+
+                if shift > max_shift:
+                    reasons.append(
+                        f'{q} quantile of {rule.column} moved {shift:.0%} '
+                        f'({threshold:g} to {value:g})')
+
+        return reasons
+
+    def _range_drift(self, max_excess):
+        reasons = []
+
+        for col in SCALED_COLS:
+            low, high = self.fitted_ranges[col]
+            min_val, max_val = self.ranges[col]
+            excess = max(low - min_val, max_val - high, 0) / \
+                ((high - low) or 1)
+
+            if excess > max_excess:
+                reasons.append(
+                    f'{col} is {excess:.0%} outside of its scaled range')
+
+        return reasons
+
+    def _add_statistics(self, cleaned, features):
+        counts = [
+            (self.brand_counts, brand_from_model_name(cleaned['model_name'])),
+            (self.location_counts, cleaned['location']),
+        ]
+
+        for totals, values in counts:
+            for value, n in values.value_counts().items():
+                totals[value] = totals.get(value, 0) + int(n)
+
+        for col, sketch in self.sketches.items():
+            sketch.add(features[col])
+
+    def to_dict(self):
+        """The state without the row hashes."""
+        return {
+            'raw_offset': self.raw_offset,
+            'raw_hash': self.raw_hash,
+            'columns': self.columns,
+            'vocabulary': self.vocabulary,
+            'brand_counts': self.brand_counts,
+            'location_counts': self.location_counts,
+            'sketches': {col: sketch.to_dict()
+                         for col, sketch in self.sketches.items()},
+            'rows': self.rows,
+            'rows_added': self.rows_added,
+            'thresholds': self.thresholds,
+            'fitted_ranges': self.fitted_ranges,
+            'ranges': self.ranges,
+            'models': self.models,
+        }
+
+    def save(self, filepath=STATE_FILE):
+        """
+        Saves the state as JSON & the row hashes next to it, in a file named
+        after the raw offset. The JSON is replaced last, an interrupted save
+        keeps the old state & its hashes.
+        """
+        filepath = Path(filepath)
+        tmp_path = filepath.with_suffix('.tmp')
+        rows_file = f'{filepath.stem}.{self.raw_offset}.rows.npy'
+
+        old = json.loads(filepath.read_text()).get('rows_file') \
+            if filepath.exists() else None
+
+        self.seen.save(filepath.with_name(rows_file))
+
+        with open(tmp_path, 'w') as f:
+            json.dump({**self.to_dict(), 'rows_file': rows_file}, f)
+
+        tmp_path.replace(filepath)
+
+        if old and old != rows_file:
+            filepath.with_name(old).unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, filepath=STATE_FILE):
+        filepath = Path(filepath)
+        state = json.loads(filepath.read_text())
+        rows_file = filepath.with_name(state.pop('rows_file'))
+
+        return cls(**state, seen=RowHashIndex.load(rows_file))
+
+
+@profiled('incremental.fit_models')
+def fit_models(state, df, model_files, test_r2):
+    """
+    Saves what each model just trained on `df` by `train_model` needs to
+    learn more rows in its artifact, `state` gets their test R^2.
+
+    Params:
+    state (IncrementalState): state of the training data.
+    df (DataFrame): the outlier free training data.
+    model_files (dict): artifact directory of each model.
+    test_r2 (dict): test R^2 of each model in the report.
+    """
+    for name, path in model_files.items():
+        model = ModelFactory().get_model(name)
+        init, _ = UPDATERS.get(model.incremental_update, (None, None))
+        learnt = {'raw_offset': state.raw_offset}
+
+        if init:
+            # same split as the training
+            trained = model(df)
+            learnt.update(init(load_artifact(path, mmap_mode=None),
+                               trained.X_train, trained.y_train))
+
+        save_extra(path, INCREMENTAL_FILE, learnt)
+        state.models[name] = {'r2': test_r2[name]}
+
+    return state
+
+
+def _check(state, model_files, size):
+    """Reasons the models can't learn the new rows, if any."""
+    data_file = Preprocessor.data_file
+
+    if size < state.raw_offset or \
+            file_hash(data_file, state.raw_offset) != state.raw_hash:
+        return [f'{data_file} was rewritten, not appended to']
+
+    for name, path in model_files.items():
+        model = ModelFactory().get_model(name)
+
+        if model.incremental_update not in UPDATERS or \
+                name not in state.models or not is_artifact(path):
+            return [f'{name} can not be trained incrementally']
+
+        learnt = load_extra(path, INCREMENTAL_FILE)
+
+        # a model ahead of the state learnt the rows of a stopped update
+        if not learnt or \
+                not state.raw_offset <= learnt['raw_offset'] <= size:
+            return [f'{name} was not trained with the incremental state']
+
+    return []
+
+
+def _new_rows(state, offsets, size):
+    """
+    The new rows of the raw file, split at the `offsets` the models learnt
+    up to. Returns the number of raw rows & the training rows of each part
+    by the offset it starts at.
+    """
+    bounds = sorted({state.raw_offset, *offsets, size})
+    raw_rows = 0
+    parts = {}
+
+    for start, end in zip(bounds, bounds[1:]):
+        raw = read_new_rows(Preprocessor.data_file, start, end)
+        raw_rows += len(raw)
+        parts[start] = state.add_rows(raw)
+
+    return raw_rows, parts
+
+
+def _delta(parts, offset):
+    """Training rows after the raw file `offset` a model learnt up to."""
+    found = [part for start, part in parts.items() if start >= offset]
+
+    return pd.concat(found) if found else \
+        pd.DataFrame(columns=FEATURE_COLS + ['price'])
+
+
+def _score(state, name, pipe, df, max_drop):
+    """R^2 of a model on rows it didn't learn yet & the reasons to train
+    it again if it dropped too much."""
+    score = Metrics().r2(_target(name, df), pipe.predict(df[FEATURE_COLS]))
+    drop = state.models[name]['r2'] - score
+
+    if drop <= max_drop:
+        return score, []
+
+    return score, [f'R^2 of {name} on the new rows is {score:.3f}, '
+                   f'{drop:.3f} below its test R^2']
+
+
+def _learn(name, path, pipe, learnt, df, share, size):
+    """Updates the model & saves it with the offset it learnt up to."""
+    model = ModelFactory().get_model(name)
+    X = df[FEATURE_COLS]
+
+    with stage(f'incremental.{name}', rows=len(df)):
+        UPDATERS[model.incremental_update][1](
+            pipe, X, _target(name, df), learnt, share)
+
+        # the model & what it learnt are swapped in together
+        replace_artifact(pipe, path, X,
+                         extras={INCREMENTAL_FILE: {**learnt,
+                                                    'raw_offset': size}},
+                         log_target=model.log_target)
+
+
+@profiled('incremental.update_models')
+def update_models(model_files, state_file=STATE_FILE,
+                  thresholds=DRIFT_THRESHOLDS, log_file=UPDATES_LOG):
+    """
+    Trains the models on the rows appended to the raw file since they were
+    last trained, using the `incremental_update` strategy of each model.
+
+    Returns the reasons the models have to be trained again on all the rows
+    instead, the models & the state are left as they are if there are any.
+
+    Params:
+    model_files (dict): artifact directory of each model.
+    state_file (str): state saved by the last training.
+    thresholds (dict): drift thresholds, see `DRIFT_THRESHOLDS`.
+    log_file (str): JSON lines file each update is logged to.
+    """
+    logger = Logger(__name__, __name__ == '__main__')
+
+    if not Path(state_file).exists():
+        return [f'no incremental state {state_file}']
+
+    state = IncrementalState.load(state_file)
+    size = Preprocessor.data_file.stat().st_size
+
+    reasons = _check(state, model_files, size)
+
+    if reasons:
+        return reasons
+
+    learnt = {name: load_extra(path, INCREMENTAL_FILE)
+              for name, path in model_files.items()}
+    rows = state.rows
+
+    with stage('incremental.rows') as event:
+        raw_rows, parts = _new_rows(
+            state, [learn['raw_offset'] for learn in learnt.values()], size)
+        event['rows'] = raw_rows
+
+    # rows each model didn't learn yet
+    deltas = {name: _delta(parts, learn['raw_offset'])
+              for name, learn in learnt.items()}
+    new_rows = sum(len(part) for part in parts.values())
+
+    logger.info(f'{raw_rows} new rows, {new_rows} left after removing the '
+                f'duplicates & outliers')
+
+    reasons = state.drift(thresholds)
+    pipes = {name: load_artifact(model_files[name], mmap_mode=None)
+             for name, df in deltas.items() if len(df)}
+    scores = {}
+
+    for name, pipe in pipes.items():
+        if len(deltas[name]) >= thresholds['min_rows']:
+            scores[name], drops = _score(state, name, pipe, deltas[name],
+                                         thresholds['max_r2_drop'])
+            reasons += drops
+
+    if not reasons:
+        for name, pipe in pipes.items():
+            _learn(name, model_files[name], pipe, learnt[name], deltas[name],
+                   len(deltas[name]) / rows, size)
+
+            logger.info(f'Updated {name} with {len(deltas[name])} rows')
+
+        state.raw_offset = size
+        state.raw_hash = file_hash(Preprocessor.data_file, size)
+        state.save(state_file)
+
+    _log_update(log_file, raw_rows, new_rows, reasons, bool(pipes), scores)
+
+    return reasons
+
+
+def _log_update(log_file, raw_rows, rows, reasons, updated, scores):
+    update = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'raw_rows': raw_rows,
+        'rows': rows,
+        'action': 'full_training' if reasons else
+                  'updated' if updated else 'none',
+        'reasons': reasons,
+        'r2': scores,
+    }
+
+    Logger(__name__, __name__ == '__main__').event(
+        'incremental_update', **update)
+
+    with open(log_file, 'a') as f:
+        f.write(json.dumps(update) + '\n')
@@ -1,33 +1,71 @@
 import numpy as np
-from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
-from sklearn.model_selection import cross_val_score
+from sklearn.model_selection import KFold, cross_val_predict
 import pandas as pd
 
 class Metrics:
 
+    # folds of the cross validation
+    cv_folds = 10
+
     def mape(self, targets, predictions):
         return np.mean(np.abs((targets - predictions)) / targets) * 100
 
     def adj_r2(self, ind_vars, targets, predictions):
-        r2 = r2_score(targets, predictions)
+        r2 = self.r2(targets, predictions)
         n = ind_vars.shape[0]
         k = ind_vars.shape[1]
         return 1-((1-r2)*(n-1)/(n-k-1))
 
-    # Model performance check
-    def model_perf(self, model, inp, out, cross_val=False):
+    def r2(self, targets, predictions):
+        ss_res = np.sum((targets - predictions) ** 2)
+        ss_tot = np.sum((targets - targets.mean()) ** 2)
+        return 1 - ss_res / ss_tot
+
+    def cross_val(self, model, inp, out, n_jobs=None):
+        """
+        Mean R^2 of the folds, same as `cross_val_score(model, inp, out,
+        cv=10).mean()`. The folds are fit once (in parallel with `n_jobs`) by
+        `cross_val_predict` & all the fold scores come from its out of fold
+        predictions.
+        """
+        cv = KFold(self.cv_folds)
+        targets = np.asarray(out, dtype=float)
+
+        predictions = cross_val_predict(model, inp, out, cv=cv, n_jobs=n_jobs)
+
+        folds = np.empty(len(targets), dtype=np.intp)
+        for fold, (_, test_idx) in enumerate(cv.split(inp)):
+            folds[test_idx] = fold
 
-        y_pred = model.predict(inp)
+        counts = np.bincount(folds)
+        fold_means = np.bincount(folds, weights=targets) / counts
+
+        ss_res = np.bincount(folds, weights=(targets - predictions) ** 2)
+        ss_tot = np.bincount(folds, weights=(targets - fold_means[folds]) ** 2)
+
+        return np.mean(1 - ss_res / ss_tot)
+
+    # Model performance check
+    def model_perf(self, model, inp, out, cross_val=False, n_jobs=None,
+                   predictions=None):
+        """
+        Params:
+        predictions (array): predictions of `model` for `inp` if already
+        made, so the model doesn't predict the same rows again.
+        """
+        y_pred = model.predict(inp) if predictions is None else predictions
         y_act = out.values
 
-        cross_val_ = cross_val_score(
-            model, inp, out, cv=10).mean() if cross_val else None
+        errors = y_act - y_pred
+
+        cross_val_ = self.cross_val(model, inp, out, n_jobs) \
+            if cross_val else None
 
         return pd.DataFrame({
-            "RMSE": np.sqrt(mean_squared_error(y_act, y_pred)),
-            "MAE": mean_absolute_error(y_act, y_pred),
+            "RMSE": np.sqrt(np.mean(errors ** 2)),
+            "MAE": np.mean(np.abs(errors)),
             "MAPE": self.mape(y_act, y_pred),
-            "R^2": r2_score(y_act, y_pred),
+            "R^2": self.r2(y_act, y_pred),
             "Adjusted R^2": self.adj_r2(inp, y_act, y_pred),
             "Cross Val Score (Mean)": cross_val_ if cross_val else None
         }, index=[0])
@@ -1,12 +1,15 @@
 from pandas import DataFrame
 import pandas as pd
 from ..utils.logger import Logger
+from ..utils.profiling import stage
 import numpy as np
 from sklearn.model_selection import train_test_split
 from .metrics import Metrics
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, MinMaxScaler
-from sklearn.impute import KNNImputer
+from .imputation import FrameImputer
+from .tuning import SuccessiveHalvingSearch
+from .artifacts import save_artifact
 from sklearn.pipeline import Pipeline
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
@@ -19,6 +22,19 @@ import pickle
 class Model:
     hyper_params = {}
 
+    # set if the model is trained on log1p(price) instead of price
+    log_target = False
+
+    # cores used by the estimator & the cross validation, None is one core
+    n_jobs = None
+
+    # how the missing numeric features are filled, see `FrameImputer`
+    imputer = 'group_median'
+
+    # how the trained model learns new rows, see `src.models.incremental`,
+    # None means it can only be trained again on all the rows
+    incremental_update = None
+
     def __init__(self, df: DataFrame, cross_validate=True):
         self.logger = Logger(__name__, __name__ == '__main__')
         self.df = df
@@ -27,9 +43,15 @@ class Model:
         self._X_train, self._X_test, self._y_train, self._y_test = train_test_split(
             self.X, self.y, test_size=.25, random_state=42)
 
+        # missing features are filled by the pipeline, only the target here
+        self.y_train = self.y_train.fillna(self.y_train.mean())
+        self.y_test = self.y_test.fillna(self.y_test.mean())
+
         self.metrics = Metrics()
 
         self.estimator = None
+        self.pipe = None
+        self._predictions = {}
 
     @property
     def X(self):
@@ -63,44 +85,52 @@ class Model:
     def y_test(self, val):
         self._y_test = val
 
-    def impute(self):
-
-        self.y_train = self.y_train.fillna(self.y_train.mean())
-        self.y_test = self.y_test.fillna(self.y_test.mean())
-
-        num_cols = [
-            col for col in self.X.columns if self.X[col].dtypes != 'object']
-
-        X_imputer = KNNImputer(n_neighbors=7, weights='distance')
-
-        X_imputer.fit(self.X_train[num_cols])
-
-        self.X_train.loc[:][num_cols] = X_imputer.fit_transform(
-            self.X_train[num_cols])
-        self.X_test.loc[:][num_cols] = X_imputer.transform(
-            self.X_test[num_cols])
-
-        y_imputer = KNNImputer(n_neighbors=3, weights='uniform')
-        y_imputer.fit([self.y_train])
-
     def train(self):
+        # named after the subclass, so each model is its own stage
+        with stage(f'{type(self).__name__}.train', rows=len(self.df)):
 
-        # first impute missing values
-        self.impute()
+            self.pipe = self._build_pipeline()
 
-        self.pipe = self._build_pipeline()
+            with stage('pipeline.fit', rows=len(self.X_train)):
+                self.pipe.fit(self.X_train, self.y_train)
 
-        self.pipe.fit(self.X_train, self.y_train)
+            self._predictions = {}
 
-        train_metrics_df = self.metrics.model_perf(
-            self.pipe, self.X_train, self.y_train, self.cross_validate)
+            # cross validation is only meaningful on the train split
+            with stage('metrics.train', rows=len(self.X_train)):
+                train_metrics_df = self.metrics.model_perf(
+                    self.pipe, self.X_train, self.y_train, self.cross_validate,
+                    self.n_jobs, predictions=self.predict_split('train'))
 
-        test_metrics_df = self.metrics.model_perf(
-            self.pipe, self.X_test, self.y_test, self.cross_validate)
+            with stage('metrics.test', rows=len(self.X_test)):
+                test_metrics_df = self.metrics.model_perf(
+                    self.pipe, self.X_test, self.y_test,
+                    predictions=self.predict_split('test'))
 
         return train_metrics_df, test_metrics_df
 
-    def hyper_tuning(self):
+    def predict_split(self, split):
+        """Predictions of the trained pipeline for the 'train' or 'test'
+        split, each split is predicted only once per training."""
+        if split not in self._predictions:
+            X = self.X_train if split == 'train' else self.X_test
+            self._predictions[split] = self.pipe.predict(X)
+
+        return self._predictions[split]
+
+    def hyper_tuning(self, search='halving', time_budget=None, n_jobs=None,
+                     log_path=None):
+        """
+        Searches the `hyper_params` of the estimator, the pipeline with the
+        best params is kept as `self.pipe`.
+
+        Params:
+        search (str): 'halving' for `SuccessiveHalvingSearch` or 'random'
+        for `RandomizedSearchCV`.
+        time_budget (float): seconds the halving search may run for.
+        n_jobs (int): configurations evaluated in parallel.
+        log_path (str): log of the halving search, used to resume it.
+        """
         _pipe_hyper_params = {}
 
         if self.hyper_params:
@@ -110,17 +140,26 @@ class Model:
             self.logger.info(f'Hyper paramerts not found for {self.estimator}')
 
         if _pipe_hyper_params:
-            self.logger.info(
-                'Performing randomized search cv for best model....')
+            self.pipe = self._build_pipeline()
 
-            self.impute()
+            if search == 'halving':
+                self.logger.info(
+                    'Performing successive halving search for best model....')
 
-            self.pipe = self._build_pipeline()
+                model = SuccessiveHalvingSearch(
+                    self.pipe, _pipe_hyper_params, cv=5, n_jobs=n_jobs,
+                    time_budget=time_budget, log_path=log_path)
+            else:
+                self.logger.info(
+                    'Performing randomized search cv for best model....')
 
-            model = RandomizedSearchCV(self.pipe, _pipe_hyper_params, cv=5)
+                model = RandomizedSearchCV(
+                    self.pipe, _pipe_hyper_params, cv=5, n_jobs=n_jobs)
 
             model.fit(self.X_train, self.y_train)
 
+            self.pipe = model.best_estimator_
+
             result_train = self.metrics.model_perf(
                 model, self.X_train, self.y_train)
 
@@ -134,7 +173,11 @@ class Model:
             return pd.concat([result_train, result_test], axis=0)
 
     def _build_pipeline(self):
+        if 'n_jobs' in self.estimator.get_params():
+            self.estimator.set_params(n_jobs=self.n_jobs)
+
         return Pipeline([
+            ('imputer', FrameImputer(self.imputer)),
             ('category_transformer', self._col_transformer()),
             ('estimator', self.estimator),
         ])
@@ -143,28 +186,45 @@ class Model:
         return ColumnTransformer([
             ("kms_driven_engine_min_max_scaler", MinMaxScaler(), [0, 6, 3, 4]),
             ("owner_ordinal_enc", OrdinalEncoder(categories=[
-             ['fourth', 'third', 'second', 'first']], handle_unknown='ignore', dtype=np.int16), [1]),
+             ['fourth', 'third', 'second', 'first']],
+             handle_unknown='use_encoded_value', unknown_value=-1,
+             dtype=np.int16), [1]),
+            # categories of the whole data, a small sample or a cv fold may
+            # miss some of them
             ("brand_location_ohe", OneHotEncoder(
+                categories=[self._categories('location'),
+                            self._categories('brand')],
                 sparse=False, handle_unknown='error', drop='first',), [2, 5]),
         ], remainder='passthrough')
 
+    def _categories(self, col):
+        return sorted(self.X[col].dropna().astype(object).unique())
+
     def save(self, filepath: str):
+        """Pickles the pipeline if the path ends with .pkl, else saves it as
+        an artifact directory, see `save_artifact`."""
         if not self.pipe:
             raise Exception(
                 'Model is not trained. Start model trainign first.')
 
-        pickle.dump(self.pipe, open(filepath, 'wb'))
+        if str(filepath).endswith('.pkl'):
+            pickle.dump(self.pipe, open(filepath, 'wb'))
+        else:
+            save_artifact(self.pipe, filepath, self.X_train,
+                          log_target=self.log_target)
 
         self.logger.info(f'Model file saved at {filepath}')
 
 
 class _LinearRegressionModel(Model):
+
+    log_target = True
+
+    incremental_update = 'least_squares'
+
     def __init__(self, df: DataFrame):
         super().__init__(df)
 
-        self.y_train = self.y_train.fillna(self.y_train.mean())
-        self.y_test = self.y_test.fillna(self.y_test.mean())
-
         self._y_train = np.log1p(self._y_train)
         self._y_test = np.log1p(self._y_test)
 
@@ -173,12 +233,14 @@ class _LinearRegressionModel(Model):
 
 class _RandomForestModel(Model):
 
+    incremental_update = 'warm_start'
+
     hyper_params = {
-        'criterion': ['mse', 'mae'],
+        'criterion': ['squared_error', 'absolute_error'],
         'n_estimators': [100,150, 200,250,300,350],
         'max_depth': [5, 10, 15, 20, 25, 30, 35, 40],
         'min_samples_split': range(2, 30),
-        'max_features': ['auto', 'sqrt', 'log2'],
+        'max_features': [1.0, 'sqrt', 'log2'],
         'min_samples_leaf':[50,60,80,100,120,150]
     }
 
@@ -190,6 +252,8 @@ class _RandomForestModel(Model):
 
 class _KNNModel(Model):
 
+    incremental_update = 'append'
+
     hyper_params = {
         'n_neighbors': [5, 7, 9, 11, 13],
         'weights': ['uniform', 'distance'],
@@ -205,11 +269,13 @@ class _KNNModel(Model):
 
 class _GradienBoostModel(Model):
 
+    incremental_update = 'warm_start'
+
     hyper_params = {
-        'loss': ['squared_error', 'ls', 'absolute_error', 'lad', 'huber', 'quantile'],
+        'loss': ['squared_error', 'absolute_error', 'huber', 'quantile'],
         'learning_rate': [.1, .01, .001, .0001],
         'n_estimators': [100, 110, 120, 130, 140, 150],
-        'criterion': ['friedman_mse', 'squared_error', 'mse', 'mae'],
+        'criterion': ['friedman_mse', 'squared_error'],
         'min_samples_split': [2, 3, 4, 5, 6, 7, 8, 9, 10],
         'max_depth': [3, 4, 5, 6, 7, 8, 9, 10]
     }
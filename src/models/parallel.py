@@ -0,0 +1,147 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+from ..utils.logger import Logger
+from .model_factory import ModelFactory
+
+
+def cpu_count():
+    """Cores this process is allowed to run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan_workers(num_models, n_jobs=-1):
+    """
+    Splits the cores between the training processes.
+
+    Returns (processes, threads per process), so that processes * threads
+    never goes over the cores. Every model gets its own process when
+    there are enough cores, the rest are used by the estimators & cross
+    validation inside each process.
+
+    Params:
+    num_models (int): models to train.
+    n_jobs (int): cores to use, -1 uses all of them.
+    """
+    cores = cpu_count() if n_jobs in (None, -1) else max(1, n_jobs)
+    processes = max(1, min(num_models, cores))
+
+    return processes, max(1, cores // processes)
+
+
+class SharedFrame:
+    """
+    DataFrame saved column by column as .npy files, which the training
+    processes open memory mapped instead of getting a pickled copy each.
+
+    Text & categorical columns are saved as category codes, only the
+    categories go along with the (small & picklable) handle.
+
+    Params:
+    directory (str): directory holding the column files.
+    meta (dict): columns, dtypes & categories written by `create`.
+    """
+
+    def __init__(self, directory, meta):
+        self.directory = Path(directory)
+        self.meta = meta
+
+    @classmethod
+    def create(cls, df, directory):
+        directory = Path(directory)
+        columns = []
+
+        np.save(directory / 'index.npy', df.index.to_numpy())
+
+        for i, col in enumerate(df.columns):
+            values = df[col]
+            info = {'name': col, 'file': f'col_{i}.npy',
+                    'dtype': str(values.dtype)}
+
+            if values.dtype == object or str(values.dtype) == 'category':
+                categorical = values.astype('category')
+                info['categories'] = categorical.cat.categories.tolist()
+                array = categorical.cat.codes.to_numpy()
+            else:
+                array = values.to_numpy()
+
+            np.save(directory / info['file'], array)
+            columns.append(info)
+
+        return cls(directory, {'columns': columns})
+
+    def load(self):
+        """The frame with its columns memory mapped from the files."""
+        index = np.load(self.directory / 'index.npy', mmap_mode='r')
+        data = {}
+
+        for info in self.meta['columns']:
+            array = np.load(self.directory / info['file'], mmap_mode='r')
+
+            if 'categories' in info:
+                values = pd.Categorical.from_codes(array, info['categories'])
+                data[info['name']] = values if info['dtype'] == 'category' \
+                    else np.asarray(values, dtype=object)
+            else:
+                data[info['name']] = array
+
+        return pd.DataFrame(data, index=index, copy=False)
+
+
+def _train_one(name, shared, n_threads, model_file):
+    """Runs in a training process, returns the results of one model."""
+    df = shared.load()
+
+    # keeps numpy/blas from starting a thread per core in every process
+    with threadpool_limits(n_threads):
+        model = ModelFactory().get_model(name)(df)
+        model.n_jobs = n_threads
+
+        train_result, test_result = model.train()
+        model.save(model_file)
+
+    return name, train_result, test_result
+
+
+def train_parallel(df, model_files, n_jobs=-1):
+    """
+    Trains the models in a pool of processes sharing the memory mapped `df`.
+
+    Params:
+    df (DataFrame): training data, including the price.
+    model_files (dict): `ModelFactory` model name -> pickle path to save to.
+    n_jobs (int): cores to use, -1 uses all of them.
+
+    Yields (name, train result, test result) as the models finish.
+    """
+    logger = Logger(__name__, __name__ == '__main__')
+
+    processes, threads = plan_workers(len(model_files), n_jobs)
+
+    logger.info(
+        f'Training {len(model_files)} models in {processes} processes '
+        f'with {threads} threads each')
+
+    with tempfile.TemporaryDirectory(prefix='train_') as tmp_dir:
+        shared = SharedFrame.create(df, tmp_dir)
+
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [
+                pool.submit(_train_one, name, shared, threads, str(path))
+                for name, path in model_files.items()
+            ]
+
+            for future in as_completed(futures):
+                name, train_result, test_result = future.result()
+                logger.info(f'Finished training {name}')
+
+                yield name, train_result, test_result
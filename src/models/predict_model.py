@@ -0,0 +1,216 @@
+from datetime import date
+from pathlib import Path
+import pickle
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from ..data.preprocessing import clean_listings
+from ..features.build_features import FeatureVocabulary, vocabulary_path
+from ..utils.logger import Logger
+from .artifacts import LazyPipeline, is_artifact
+from .model_factory import ModelFactory
+
+
+# order of the columns the model pipelines are trained on
+FEATURE_COLS = ['kms_driven', 'owner', 'location', 'mileage',
+                'power', 'brand', 'engine', 'age']
+
+NUMERIC_FEATURE_COLS = ['kms_driven', 'mileage', 'power', 'engine', 'age']
+
+
+def model_path(model_name):
+    """Artifact directory of the model, or its pickle if it was trained
+    before artifacts were added."""
+    path = Path(f'models/{model_name}_model')
+    return path if is_artifact(path) else path.with_suffix('.pkl')
+
+
+class Predictor:
+    """
+    Predicts the price of raw listings using a trained model pipeline.
+
+    The pipeline is loaded once & listings are scored in batches. Listings
+    should look like the rows of `data/raw/data.csv`, they are cleaned &
+    turned into features with the `FeatureVocabulary` saved next to the
+    model, so the training data is never needed.
+
+    Artifact directories are loaded lazily & memory mapped on the first
+    prediction, pickles are loaded right away.
+
+    Params:
+    model_path (str): artifact directory or pickle saved by `Model.save`.
+    log_target (bool): set if the model was trained on log1p(price), the
+    predictions are converted back to rupees. Artifacts know it already.
+    batch_size (int): number of listings scored at once.
+    """
+
+    def __init__(self, model_path, log_target=False, batch_size=50_000):
+        self.logger = Logger(__name__, __name__ == '__main__')
+        self.model_path = Path(model_path)
+        self.log_target = log_target
+        self.batch_size = batch_size
+
+        if not self.model_path.exists():
+            err = f'Model file does not exist {self.model_path}'
+            self.logger.error(err)
+            raise FileNotFoundError(err)
+
+        if is_artifact(self.model_path):
+            self.pipe = LazyPipeline(self.model_path)
+            self.log_target = self.pipe.manifest.get('log_target', log_target)
+            self._check_features(self.pipe.feature_names)
+        else:
+            with open(self.model_path, 'rb') as f:
+                self.pipe = pickle.load(f)
+
+        self.vocabulary = self._load_vocabulary()
+
+        self.logger.info(f'Loaded model {self.model_path}')
+
+    @classmethod
+    def from_name(cls, model_name, **kwargs):
+        """Loads the model saved by `train_model` for a `ModelFactory` name."""
+        model = ModelFactory().get_model(model_name)
+
+        return cls(model_path(model_name), log_target=model.log_target,
+                   **kwargs)
+
+    def load(self):
+        """Loads a lazy artifact now instead of on the first prediction."""
+        if isinstance(self.pipe, LazyPipeline):
+            self.pipe.pipe
+
+        return self
+
+    def features(self, listings):
+        """Builds the model input from raw listings."""
+        df = clean_listings(pd.DataFrame(listings))
+
+        return self.vocabulary.transform(df)[FEATURE_COLS]
+
+    def predict(self, listings):
+        """
+        Predicts the price of each listing.
+
+        Missing numeric details are filled by the imputer of the pipeline.
+        Models saved without an imputer can't score such listings, they get
+        NaN as their price.
+        """
+        X = self.features(listings)
+        prices = np.full(len(X), np.nan)
+
+        if 'imputer' in self.pipe.named_steps:
+            complete = np.ones(len(X), dtype=bool)
+        else:
+            complete = X[NUMERIC_FEATURE_COLS].notna().all(axis=1).to_numpy()
+
+        if complete.any():
+            predictions = self.pipe.predict(X[complete])
+            prices[complete] = np.expm1(
+                predictions) if self.log_target else predictions
+
+        return prices
+
+    def predict_batches(self, batches):
+        """Yields each batch of listings along with its predicted prices."""
+        total_rows = 0
+        start = time.perf_counter()
+
+        for batch in batches:
+            prices = self.predict(batch)
+            total_rows += len(batch)
+
+            elapsed = time.perf_counter() - start
+            self.logger.info(
+                f'Scored {total_rows} listings, '
+                f'{total_rows / elapsed:.0f} rows/sec')
+
+            yield batch, prices
+
+    def predict_file(self, input_path, output_path):
+        """
+        Predicts the listings of a csv or parquet file batch by batch.
+
+        Only one batch is held in memory, the input rows are written to
+        `output_path` as csv with a `predicted_price` column.
+
+        Returns the number of rows scored.
+        """
+        total_rows = 0
+        start = time.perf_counter()
+
+        batches = self.predict_batches(self._read_batches(Path(input_path)))
+
+        for i, (batch, prices) in enumerate(batches):
+            batch = batch.assign(predicted_price=prices)
+            batch.to_csv(str(output_path), index=False,
+                         mode='w' if i == 0 else 'a', header=i == 0)
+            total_rows += len(batch)
+
+        elapsed = time.perf_counter() - start
+        self.logger.info(
+            f'Saved predictions of {total_rows} listings at {output_path} '
+            f'in {elapsed:.2f}s '
+            f'({total_rows / max(elapsed, 1e-9):.0f} rows/sec)')
+
+        return total_rows
+
+    def _read_batches(self, path):
+        if path.suffix == '.parquet':
+            import pyarrow.parquet as pq
+
+            for batch in pq.ParquetFile(str(path)).iter_batches(
+                    batch_size=self.batch_size):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(str(path), chunksize=self.batch_size)
+
+    def _check_features(self, feature_names):
+        if feature_names != FEATURE_COLS:
+            err = (f'{self.model_path} was trained on {feature_names}, '
+                   f'expected {FEATURE_COLS}')
+            self.logger.error(err)
+            raise ValueError(err)
+
+    def _load_vocabulary(self):
+        path = vocabulary_path(self.model_path)
+
+        if path.exists():
+            return FeatureVocabulary.load(path)
+
+        self.logger.info(
+            f'Vocabulary file does not exist {path}, using the categories '
+            'of the model pipeline')
+
+        return self._vocabulary_from_pipeline()
+
+    def _vocabulary_from_pipeline(self):
+        """Locations & brands the one hot encoder of the pipeline was fit on,
+        for models saved without a vocabulary. The age is calculated from the
+        current year."""
+        encoder = self.pipe.named_steps['category_transformer'] \
+            .named_transformers_['brand_location_ohe']
+
+        locations, brands = encoder.categories_
+
+        return FeatureVocabulary(brands, locations, date.today().year)
+
+
+@click.command()
+@click.argument('input_path', type=click.Path(exists=True))
+@click.argument('output_path', type=click.Path())
+@click.option('--model', 'model_name', default='gradient_boost',
+              type=click.Choice(list(ModelFactory.models)),
+              help='Trained model to use for prediction.')
+@click.option('--batch-size', default=50_000, help='Listings scored at once.')
+def main(input_path, output_path, model_name, batch_size):
+    """Predicts the price of the listings in INPUT_PATH (csv or parquet)."""
+    predictor = Predictor.from_name(model_name, batch_size=batch_size)
+    predictor.predict_file(input_path, output_path)
+
+
+if __name__ == '__main__':
+    main()
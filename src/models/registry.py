@@ -0,0 +1,191 @@
+from collections import OrderedDict
+from pathlib import Path
+import threading
+import time
+
+import pandas as pd
+
+from ..utils.logger import Logger
+from .artifacts import is_artifact
+from .model_factory import ModelFactory
+from .predict_model import Predictor
+
+
+def _path_size(path):
+    path = Path(path)
+
+    if path.is_file():
+        return path.stat().st_size
+
+    return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+
+class ModelRegistry:
+    """
+    Index of the trained models in `models_dir` & their test metrics from
+    the performance report, with an LRU cache of the loaded models.
+
+    A model is named after its file without the `_model` suffix, e.g
+    `knn` or `random_forest_hyper_tuned`, artifacts win over pickles of the
+    same name. 'best' is the model with the highest test Adjusted R^2.
+
+    The cache keeps the loaded `Predictor`s until their size on disk adds
+    up to more than `cache_bytes`, then the least recently used ones are
+    dropped. The last loaded model is always kept.
+
+    Params:
+    models_dir (str): directory of the trained models.
+    report_file (str): performance report written by `train_model`.
+    cache_bytes (int): size of the models kept loaded.
+    """
+
+    def __init__(self, models_dir='models',
+                 report_file='reports/model_performace_report.csv',
+                 cache_bytes=512 * 1024 ** 2):
+        self.logger = Logger(__name__, __name__ == '__main__')
+        self.models_dir = Path(models_dir)
+        self.report_file = Path(report_file)
+        self.cache_bytes = cache_bytes
+
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+        self.refresh()
+
+    def refresh(self):
+        """Scans the models directory & the report again."""
+        paths = {}
+
+        for path in sorted(self.models_dir.iterdir()):
+            if not path.name.endswith(('_model', '_model.pkl')):
+                continue
+
+            if path.suffix == '.pkl':
+                # pickles of models saved before artifacts were added
+                paths.setdefault(path.stem[:-len('_model')], path)
+            elif is_artifact(path):
+                paths[path.name[:-len('_model')]] = path
+
+        self.paths = paths
+        self.metrics = self._read_metrics()
+
+        return self
+
+    @property
+    def names(self):
+        return list(self.paths)
+
+    def __contains__(self, name):
+        return name == 'best' or name in self.paths
+
+    def resolve(self, name='best'):
+        """Model name for `name`, 'best' gives the best scoring model."""
+        if name != 'best':
+            if name not in self.paths:
+                raise ValueError(f'{name}: This model does not exist!')
+
+            return name
+
+        scored = {model: metrics['Adjusted R^2']
+                  for model, metrics in self.metrics.items()
+                  if model in self.paths}
+
+        if not scored:
+            raise ValueError(
+                f'No trained model found in {self.report_file} & '
+                f'{self.models_dir}')
+
+        return max(scored, key=scored.get)
+
+    def entries(self):
+        """Path, size on disk & test metrics of every model."""
+        return [{'name': name, 'path': str(path), 'bytes': _path_size(path),
+                 **self.metrics.get(name, {})}
+                for name, path in self.paths.items()]
+
+    def get(self, name='best'):
+        """The loaded `Predictor` of a model, from the cache if possible."""
+        name = self.resolve(name)
+
+        with self._lock:
+            if name in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(name)
+                return self._cache[name][0]
+
+            self.misses += 1
+
+            start = time.perf_counter()
+            predictor = self._load(name)
+            self.load_seconds += time.perf_counter() - start
+
+            size = _path_size(self.paths[name])
+            self._cache[name] = (predictor, size)
+            self._cached_bytes += size
+
+            self._evict()
+
+            return predictor
+
+    def model(self, name):
+        """Stand in for the predictor of `name` which gets it from the
+        registry on every call, so it can be evicted & loaded again."""
+        return _RegistryModel(self, name)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'avg_load_seconds':
+                    self.load_seconds / self.misses if self.misses else None,
+                'cached_models': list(self._cache),
+                'cached_bytes': self._cached_bytes,
+                'cache_bytes': self.cache_bytes,
+            }
+
+    def _load(self, name):
+        path = self.paths[name]
+        base_model = ModelFactory.models.get(name.replace('_hyper_tuned', ''))
+
+        return Predictor(
+            path, log_target=base_model.log_target if base_model else False
+        ).load()
+
+    def _evict(self):
+        while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+            name, (_, size) = self._cache.popitem(last=False)
+            self._cached_bytes -= size
+            self.evictions += 1
+
+            self.logger.info(f'Evicted model {name} from the cache')
+
+    def _read_metrics(self):
+        if not self.report_file.exists():
+            return {}
+
+        report = pd.read_csv(self.report_file)
+        test = report[report['type'] == 'Test'].drop(columns='type')
+
+        return {row.pop('model'): row
+                for row in test.to_dict('records')}
+
+
+class _RegistryModel:
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def predict(self, listings):
+        return self.registry.get(self.name).predict(listings)
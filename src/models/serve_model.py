@@ -0,0 +1,400 @@
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import json
+import math
+import queue
+import threading
+import time
+
+import click
+import numpy as np
+
+from ..features.build_features import parse_cache_info
+from ..utils.logger import Logger
+from .registry import ModelRegistry
+
+
+class LatencyStats:
+    """
+    Keeps request counters & the latency of the most recent requests.
+
+    Params:
+    window (int): number of recent latencies used for the percentiles.
+    """
+
+    def __init__(self, window=10_000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.started = time.monotonic()
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+
+    def record_batch(self, latencies, errors=0):
+        with self._lock:
+            self._latencies.extend(latencies)
+            self.requests += len(latencies)
+            self.batches += 1
+            self.errors += errors
+
+    def summary(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            requests, batches = self.requests, self.batches
+            errors = self.errors
+
+        uptime = time.monotonic() - self.started
+        p50, p95, p99 = np.percentile(
+            latencies, [50, 95, 99]) if len(latencies) else (None,) * 3
+
+        return {
+            'requests': requests,
+            'errors': errors,
+            'batches': batches,
+            'avg_batch_size': requests / batches if batches else None,
+            'requests_per_sec': requests / uptime,
+            'latency_ms': {'p50': p50, 'p95': p95, 'p99': p99},
+        }
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single listing requests into batches.
+
+    A background thread waits for the first request, then collects more
+    until there are `max_batch_size` of them or `max_wait_ms` has passed &
+    predicts them all with one `Predictor.predict` call.
+
+    Params:
+    predictor (Predictor): loaded model used for predictions.
+    max_batch_size (int): maximum number of listings predicted at once.
+    max_wait_ms (float): maximum time a request waits for the batch to fill.
+    """
+
+    def __init__(self, predictor, max_batch_size=64, max_wait_ms=5):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = LatencyStats()
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, listing):
+        """Queues a listing & returns a future of its predicted price."""
+        future = Future()
+        self._queue.put((listing, future, time.monotonic()))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        item = self._queue.get()
+
+        if item is None:
+            return None
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            if item is None:
+                # put the stop signal back for the next round
+                self._queue.put(None)
+                break
+
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            if batch is None:
+                return
+
+            results = self._predict([listing for listing, _, _ in batch])
+            done = time.monotonic()
+
+            for (_, future, _), (price, error) in zip(batch, results):
+                if error is None:
+                    future.set_result(float(price))
+                else:
+                    future.set_exception(error)
+
+            self.stats.record_batch(
+                [done - queued for _, _, queued in batch],
+                errors=sum(error is not None for _, error in results))
+
+    def _predict(self, listings):
+        """(price, error) of each listing. If the batch fails the listings
+        are predicted one at a time, so only the bad ones fail."""
+        try:
+            return [(price, None)
+                    for price in self.predictor.predict(listings)]
+        except Exception as e:
+            if len(listings) == 1:
+                return [(None, e)]
+
+        results = []
+
+        for listing in listings:
+            results.extend(self._predict([listing]))
+
+        return results
+
+
+class ModelBatchers:
+    """
+    A `MicroBatcher` per model of the registry, made on the first request
+    for the model. The batchers get the predictor from the registry for
+    every batch, so the registry is free to evict models which are not used.
+
+    Params:
+    registry (ModelRegistry): the trained models.
+    max_batch_size (int): passed to each `MicroBatcher`.
+    max_wait_ms (float): passed to each `MicroBatcher`.
+    """
+
+    def __init__(self, registry, max_batch_size=64, max_wait_ms=5):
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """Model name `name` resolves to & its batcher."""
+        name = self.registry.resolve(name)
+
+        with self._lock:
+            if name not in self._batchers:
+                self._batchers[name] = MicroBatcher(
+                    self.registry.model(name), self.max_batch_size,
+                    self.max_wait_ms)
+
+            return name, self._batchers[name]
+
+    def items(self):
+        with self._lock:
+            return list(self._batchers.items())
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict?model=<name>  body is a listing or a list of listings,
+                                name can be any model of the registry or
+                                'best'
+    GET  /metrics               latency & throughput of each model, the
+                                registry cache & the model name parsing
+                                cache hit rates
+    GET  /health
+    """
+
+    # keeps the connections alive between requests
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+
+        if path == '/health':
+            self._send_json({'status': 'ok',
+                             'models': self.batchers.registry.names})
+        elif path == '/metrics':
+            self._send_json({
+                'models': {name: batcher.stats.summary()
+                           for name, batcher in self.batchers.items()},
+                'registry': self.batchers.registry.stats(),
+                'model_name_cache': parse_cache_info(),
+            })
+        else:
+            self._send_json({'error': 'Not found'}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+
+        # read before any reply, on a keep-alive connection an unread body
+        # would be parsed as the next request
+        body = self._read_body()
+
+        if url.path != '/predict':
+            self._send_json({'error': 'Not found'}, 404)
+            return
+
+        model_name = parse_qs(url.query).get('model', [self.default_model])[0]
+
+        try:
+            model_name, batcher = self.batchers.get(model_name)
+        except ValueError:
+            self._send_json({'error': f'Unknown model {model_name}'}, 404)
+            return
+
+        try:
+            listings, single = self._parse_listings(body)
+        except ValueError as e:
+            self._send_json({'error': str(e)}, 400)
+            return
+
+        futures = [batcher.submit(listing) for listing in listings]
+
+        try:
+            prices = [self._to_json(f.result()) for f in futures]
+        except Exception as e:
+            self.logger.error(f'Prediction failed: {e}')
+            self._send_json({'error': 'Prediction failed'}, 500)
+            return
+
+        if single:
+            self._send_json({'model': model_name, 'price': prices[0]})
+        else:
+            self._send_json({'model': model_name, 'prices': prices})
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+
+        if length < 0:
+            # where the body ends is unknown, the connection can't be reused
+            self.close_connection = True
+            return b''
+
+        return self.rfile.read(length)
+
+    @staticmethod
+    def _parse_listings(body):
+        """Listings of the body & whether it was a single one, ValueError
+        if the body is not a listing or a list of listings."""
+        try:
+            listings = json.loads(body)
+        except ValueError:
+            raise ValueError('Invalid JSON body')
+
+        single = isinstance(listings, dict)
+
+        if single:
+            listings = [listings]
+
+        if not isinstance(listings, list) or \
+                not all(isinstance(listing, dict) for listing in listings):
+            raise ValueError('Body must be a listing or a list of listings')
+
+        return listings, single
+
+    def log_message(self, format, *args):
+        # one line per request is too much on the hot path
+        pass
+
+    @staticmethod
+    def _to_json(price):
+        return None if math.isnan(price) else price
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PredictionServer(ThreadingHTTPServer):
+
+    # default backlog of 5 resets connections when many clients connect at once
+    request_queue_size = 256
+
+
+def make_server(model_names, host='127.0.0.1', port=8000,
+                max_batch_size=64, max_wait_ms=5, registry=None):
+    """
+    Loads the models into the registry cache & returns a server ready to
+    `serve_forever`. Other models of the registry are loaded on their first
+    request, the first of `model_names` is used when a request names none.
+    """
+    logger = Logger(__name__, True)
+
+    registry = registry or ModelRegistry()
+    batchers = ModelBatchers(registry, max_batch_size, max_wait_ms)
+
+    for name in model_names:
+        registry.get(name)
+        batchers.get(name)
+        logger.info(f'Loaded model {registry.resolve(name)}')
+
+    handler = type('Handler', (PredictionHandler,), {
+        'batchers': batchers,
+        'default_model': model_names[0] if model_names else 'best',
+        'logger': logger,
+    })
+
+    return PredictionServer((host, port), handler)
+
+
+@click.command()
+@click.option('--model', 'model_names', multiple=True,
+              help='Models to load up front, a model name or best, defaults '
+                   'to best. The first one is used when a request names no '
+                   'model.')
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8000)
+@click.option('--max-batch-size', default=64,
+              help='Maximum listings predicted together.')
+@click.option('--max-wait-ms', default=5.0,
+              help='Maximum time a request waits for the batch to fill.')
+@click.option('--models-dir', default='models', type=click.Path(exists=True),
+              help='Directory of the trained models.')
+@click.option('--cache-mb', default=512.0,
+              help='Size of the models kept loaded, least recently used '
+                   'ones are evicted beyond it.')
+def main(model_names, host, port, max_batch_size, max_wait_ms, models_dir,
+         cache_mb):
+    """Serves price predictions over HTTP."""
+    registry = ModelRegistry(models_dir, cache_bytes=int(cache_mb * 1024 ** 2))
+
+    if not registry.names:
+        raise click.UsageError('No trained models found in models directory.')
+
+    model_names = list(model_names) or ['best']
+
+    for name in model_names:
+        if name not in registry:
+            raise click.BadParameter(
+                f'{name}, choose from best, {", ".join(registry.names)}',
+                param_hint='--model')
+
+    server = make_server(model_names, host, port, max_batch_size,
+                         max_wait_ms, registry)
+
+    Logger(__name__, True).info(f'Serving predictions on http://{host}:{port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
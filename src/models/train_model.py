@@ -1,11 +1,23 @@
+import click
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from datetime import date
+from ..data.cache import StageCache, file_hash
 from ..data.preprocessing import Preprocessor
-from ..features.build_features import FeatureBuilder
+from ..features.build_features import (
+    FeatureBuilder, FeatureVocabulary, vocabulary_path)
 from ..utils.logger import Logger
-from ..features.outliers import Outliers
+from ..utils.profiling import enable, profiled
+from ..features.outliers import DEFAULT_RULES, Outliers
+from .incremental import (
+    STATE_FILE, STATE_VERSION, IncrementalState, fit_models, update_models)
 from .model_factory import ModelFactory
+from .parallel import train_parallel
+
+
+# cut-offs used to remove the outliers of the training data
+OUTLIERS_FILE = 'models/outlier_thresholds.json'
 
 
 def find_best_result(df: pd.DataFrame):
@@ -20,45 +32,144 @@ def save_perf_result(filename: str, df: pd.DataFrame):
     df.to_csv(filename,index=False)
 
 
-def main():
+def model_file(name):
+    # artifact directory, see `save_artifact`
+    return f'models/{name}_model'
+
+
+def train_serial(df, n_jobs=-1):
+    """Trains the models one after another, yields their results. Each
+    model uses `n_jobs` cores for its estimator & cross validation."""
     logger = Logger(__name__, __name__ == '__main__')
 
-    preprocessor = Preprocessor()
+    for name, model in ModelFactory.models.items():
 
-    df = preprocessor.start(True)
+        logger.info(f'Training Model :: {name}')
+        my_model = model(df)
+        my_model.n_jobs = n_jobs
+        train_result, test_result = my_model.train()
 
-    feat_builder = FeatureBuilder()
+        # save each model
+        my_model.save(model_file(name))
 
-    df = feat_builder.build()
+        yield name, train_result, test_result
 
-    df = Outliers(df).detect()
 
-    logger.info('Training Data Points', df.shape)
+def prepare_data(cache=None):
+    """
+    Cleans the raw data, builds the features & removes the outliers.
 
-    best_model = None
+    With a `StageCache` a stage is loaded from the cache if the raw file, its
+    params & its code didn't change since it last ran, the stages before it
+    aren't even loaded.
 
-    results = []
+    The statistics the incremental training starts from are taken along
+    the way, from the raw file as it was when it was read.
 
-    for name, model in ModelFactory.models.items():
+    Returns the training data, the feature vocabulary, the fitted outliers
+    & the `IncrementalState`.
+    """
+    def run(key, compute):
+        return cache.cached(key, compute) if cache else compute()
 
-        logger.info(f'Training Model :: {name}')
-        my_model = model(df)
-        train_result, test_result = my_model.train()
+    def key(*args, **kwargs):
+        return cache.key(*args, **kwargs) if cache else None
+
+    clean_key = key('clean', Preprocessor.cache_version,
+                    files=[Preprocessor.data_file],
+                    params={'state_version': STATE_VERSION})
+
+    features_key = key(
+        'features', FeatureBuilder.cache_version, parents=[clean_key],
+        params={'num_brands': FeatureBuilder.num_brands,
+                'num_locations': FeatureBuilder.num_locations,
+                # the age changes with the year
+                'reference_year': date.today().year})
+
+    outliers_key = key(
+        'outliers', Outliers.cache_version, parents=[features_key],
+        params={'rules': [repr(rule) for rule in DEFAULT_RULES]})
+
+    def clean():
+        # rows appended while training are left to the incremental training
+        raw_offset = Preprocessor.data_file.stat().st_size
+
+        preprocessor = Preprocessor()
+        preprocessor.start(True, nbytes=raw_offset)
+
+        # the features are built from the saved dataset, dtypes included
+        return preprocessor.store.load(preprocessor.dataset), {
+            'raw_offset': raw_offset,
+            'raw_hash': file_hash(Preprocessor.data_file, raw_offset)}
+
+    def features():
+        cleaned, meta = run(clean_key, clean)
 
+        feat_builder = FeatureBuilder()
+        df = feat_builder.build(True, df=cleaned)
+
+        state = IncrementalState.fit(cleaned, df, feat_builder.vocabulary,
+                                     meta['raw_offset'], meta['raw_hash'])
+
+        return df, {'vocabulary': feat_builder.vocabulary.to_dict(),
+                    'state': state.to_dict(),
+                    'seen': state.seen.hashes.tolist()}
+
+    def remove_outliers():
+        df, meta = run(features_key, features)
+
+        outliers = Outliers(df)
+        df = outliers.detect()
+
+        state = IncrementalState(**meta['state'], seen=meta['seen'])
+        state.fit_outliers(df, outliers.thresholds)
+
+        return df, {**meta, 'thresholds': outliers.thresholds,
+                    'state': state.to_dict()}
+
+    df, meta = run(outliers_key, remove_outliers)
+
+    return (df, FeatureVocabulary(**meta['vocabulary']),
+            Outliers.from_thresholds(meta['thresholds']),
+            IncrementalState(**meta['state'], seen=meta['seen']))
+
+
+@profiled('train_model')
+def train(parallel, n_jobs, tuning_budget, cache=None, ask_tuning=True):
+    logger = Logger(__name__, __name__ == '__main__')
+
+    df, vocabulary, outliers, state = prepare_data(cache)
+    outliers.save(OUTLIERS_FILE)
+
+    logger.event('training_data', rows=df.shape[0], columns=df.shape[1])
+
+    best_model = None
+
+    if parallel:
+        trained = train_parallel(
+            df, {name: model_file(name) for name in ModelFactory.models},
+            n_jobs)
+    else:
+        trained = train_serial(df, n_jobs)
+
+    results = {}
+
+    for name, train_result, test_result in trained:
         train_result['type'] = 'Train'
         train_result['model'] = name
 
         test_result['type'] = 'Test'
         test_result['model'] = name
 
-        results.append(train_result)
-        results.append(test_result)
-
-        # save each model
-        my_model.save(f'models/{name}_model.pkl')
+        results[name] = [train_result, test_result]
 
+        # the features of new listings are made with the same vocabulary
+        vocabulary.save(vocabulary_path(model_file(name)))
 
-    result_df = pd.concat(results, axis=0, ignore_index=True)
+    # same order as the serial training, whichever model finished first
+    result_df = pd.concat(
+        [result for name in ModelFactory.models for result in results[name]],
+        axis=0, ignore_index=True)
 
     print(result_df)
 
@@ -68,6 +179,12 @@ def main():
 
     logger.info(f"Saving performace report {report_file}")
 
+    # the rows appended to the raw file later are learnt from this state
+    test_results = result_df[result_df['type'] == 'Test']
+    fit_models(state, df,
+               {name: model_file(name) for name in ModelFactory.models},
+               dict(zip(test_results['model'], test_results['R^2']))
+               ).save(STATE_FILE)
 
     best_result = find_best_result(result_df)
 
@@ -79,7 +196,8 @@ def main():
     best_model = ModelFactory().get_model(model_name)
 
     user_inp = input(
-        'Do you want to perform hyper parameter tuning of the best model?[Y/n](default=n)')
+        'Do you want to perform hyper parameter tuning of the best '
+        'model?[Y/n](default=n)') if ask_tuning else None
 
     if user_inp and user_inp.lower() == 'y' and best_model:
         logger.info(f'Started hyper parameter tuning of {best_result.model}')
@@ -88,7 +206,10 @@ def main():
 
         logger.info(f"Using hyper parameters : {mdl.hyper_params}",)
 
-        result = mdl.hyper_tuning()
+        # an interrupted search resumes from its log when started again
+        result = mdl.hyper_tuning(
+            time_budget=tuning_budget, n_jobs=n_jobs,
+            log_path=f'reports/{model_name}_tuning_log.jsonl')
 
         best_result = find_best_result(result)
 
@@ -96,7 +217,63 @@ def main():
             f'Best score after hyper parameter tuning is {best_result["Adjusted R^2"]}')
 
         # print(best_result)
-        mdl.save(f'models/{model_name}_hyper_tuned_model.pkl')
+        tuned_file = f'models/{model_name}_hyper_tuned_model'
+        mdl.save(tuned_file)
+        vocabulary.save(vocabulary_path(tuned_file))
+
+        # the registry finds the tuned model's scores in the report
+        result['model'] = f'{model_name}_hyper_tuned'
+        save_perf_result(report_file, pd.concat(
+            [result_df, result], axis=0, ignore_index=True))
+
+
+@click.command()
+@click.option('--parallel', is_flag=True,
+              help='Train the models at the same time in separate processes.')
+@click.option('--n-jobs', default=-1,
+              help='Cores used by the training, its cross validation & the '
+                   'tuning, -1 uses all.')
+@click.option('--tuning-budget', default=None, type=float,
+              help='Seconds the hyper parameter search may run for.')
+@click.option('--profile', default=None, type=click.Path(),
+              help='JSON lines file to record the time of each stage to, '
+                   'see `python -m src.utils.profiling`.')
+@click.option('--profile-memory', is_flag=True,
+              help='Record the peak memory of each stage too, slower.')
+@click.option('--cache/--no-cache', 'use_cache', default=True,
+              help='Reuse the cleaned, features & outlier free data of '
+                   'earlier runs if nothing they depend on changed.')
+@click.option('--cache-mb', default=1024.0,
+              help='Size of the stage cache, least recently used entries '
+                   'are deleted beyond it.')
+@click.option('--incremental', is_flag=True,
+              help='Train the models only on the rows appended to the raw '
+                   'file since the last training, all the models are '
+                   'trained again if the data drifted.')
+def main(parallel, n_jobs, tuning_budget, profile, profile_memory, use_cache,
+         cache_mb, incremental):
+    if profile:
+        enable(profile, profile_memory)
+
+    cache = StageCache(max_bytes=int(cache_mb * 1024 ** 2)) \
+        if use_cache else None
+
+    if incremental:
+        logger = Logger(__name__, __name__ == '__main__')
+
+        reasons = update_models(
+            {name: model_file(name) for name in ModelFactory.models})
+
+        if not reasons:
+            return
+
+        logger.info(f'Training all the models again: {"; ".join(reasons)}')
+
+        # nobody to answer the tuning prompt in incremental runs
+        train(parallel, n_jobs, tuning_budget, cache, ask_tuning=False)
+        return
+
+    train(parallel, n_jobs, tuning_budget, cache)
 
 
 if __name__ == '__main__':
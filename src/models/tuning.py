@@ -0,0 +1,233 @@
+from pathlib import Path
+import hashlib
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.base import clone
+from sklearn.model_selection import ParameterSampler, cross_val_score
+
+from ..utils.logger import Logger
+
+
+def _jsonable(params):
+    return {k: v.item() if isinstance(v, np.generic) else v
+            for k, v in params.items()}
+
+
+def _fingerprint(X, y):
+    """Hash of the rows & target, results of other data are not reused."""
+    hashes = pd.util.hash_pandas_object(pd.concat([X, y], axis=1), index=True)
+
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def _evaluate(pipe, params, X, y, cv):
+    """Mean cv score of one configuration, or the error it failed with."""
+    start = time.perf_counter()
+
+    try:
+        model = clone(pipe).set_params(**params)
+        score = cross_val_score(model, X, y, cv=cv, error_score='raise').mean()
+        error = None
+    except Exception as e:
+        score, error = None, f'{type(e).__name__}: {e}'
+
+    return {'score': score, 'error': error,
+            'seconds': time.perf_counter() - start}
+
+
+class SuccessiveHalvingSearch:
+    """
+    Hyper parameter search which tries many configurations on a small sample
+    of the rows & keeps only the best 1/`factor` of them for the next round,
+    which gets `factor` times more rows. The last round uses all the rows.
+
+    Configurations raising an error are dropped right away. Every result is
+    appended to `log_path`, a search started again with the same log skips
+    what was already evaluated on the same data. The search stops starting
+    new evaluations once `time_budget` is used up & the best configuration
+    so far wins. If no configuration was evaluated by then the pipeline is
+    kept with its own params.
+
+    Params:
+    pipe (Pipeline): pipeline to tune.
+    param_distributions (dict): pipeline params to sample from.
+    n_candidates (int): configurations sampled for the first round.
+    factor (int): share of configurations kept & growth of rows per round.
+    cv (int): folds of each evaluation.
+    n_jobs (int): configurations evaluated in parallel.
+    time_budget (float): seconds, None for no limit.
+    log_path (str): JSON lines file of the evaluated configurations.
+    random_state (int): seed of the sampling of configurations & rows.
+    """
+
+    def __init__(self, pipe, param_distributions, n_candidates=27, factor=3,
+                 cv=5, n_jobs=None, time_budget=None, log_path=None,
+                 random_state=42):
+        self.logger = Logger(__name__, __name__ == '__main__')
+        self.pipe = pipe
+        self.param_distributions = param_distributions
+        self.n_candidates = n_candidates
+        self.factor = factor
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.time_budget = time_budget
+        self.log_path = Path(log_path) if log_path else None
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        self._started = time.perf_counter()
+        self._data = _fingerprint(X, y)
+        self._results = self._read_log()
+        self.cv_results_ = []
+
+        candidates = [_jsonable(params) for params in ParameterSampler(
+            self.param_distributions, self.n_candidates,
+            random_state=self.random_state)]
+
+        # same row order on every run, so a resumed search sees the same rows
+        rows = np.random.RandomState(self.random_state).permutation(len(X))
+
+        for resource in self._resources(len(X)):
+            if self._out_of_time():
+                break
+
+            X_round = X.iloc[rows[:resource]]
+            y_round = y.iloc[rows[:resource]]
+            scores = self._run_round(candidates, resource, X_round, y_round)
+
+            self.logger.info(
+                f'Evaluated {len(scores)} of {len(candidates)} configurations '
+                f'on {resource} rows')
+
+            if not scores:
+                break
+
+            ranked = sorted(scores, key=lambda i: scores[i], reverse=True)
+            self.best_params_ = candidates[ranked[0]]
+            self.best_score_ = scores[ranked[0]]
+
+            keep = max(1, len(candidates) // self.factor)
+            candidates = [candidates[i] for i in ranked[:keep]]
+
+        if hasattr(self, 'best_params_'):
+            self.logger.info(
+                f'Best configuration {self.best_params_} with score '
+                f'{self.best_score_}, refitting on all the rows')
+        else:
+            self.logger.warning(
+                'No configuration could be evaluated within the time budget, '
+                'keeping the untuned pipeline')
+            self.best_params_, self.best_score_ = {}, None
+
+        self.best_estimator_ = clone(self.pipe).set_params(**self.best_params_)
+        self.best_estimator_.fit(X, y)
+
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def _resources(self, n_samples):
+        """Rows used by each round, growing by `factor` up to all the rows."""
+        # counted with integers, float logs give an extra round for 27 & 3
+        rounds, kept = 1, 1
+
+        while kept < self.n_candidates:
+            kept *= self.factor
+            rounds += 1
+
+        min_rows = max(self.cv * 20, n_samples // self.factor ** (rounds - 1))
+
+        resources = []
+        resource = min(min_rows, n_samples)
+
+        while resource < n_samples and len(resources) < rounds - 1:
+            resources.append(resource)
+            resource *= self.factor
+
+        return resources + [n_samples]
+
+    def _run_round(self, candidates, resource, X, y):
+        """Scores of the candidates of a round by index, errors left out."""
+        scores = {}
+        pending = []
+
+        for i, params in enumerate(candidates):
+            result = self._results.get(
+                self._key(params, resource, self._data))
+
+            if result is None:
+                pending.append(i)
+            elif result['error'] is None:
+                scores[i] = result['score']
+
+        batch_size = self._workers()
+
+        with Parallel(n_jobs=self.n_jobs) as parallel:
+            for start in range(0, len(pending), batch_size):
+                if self._out_of_time():
+                    self.logger.info(
+                        'Time budget used up, stopping the search')
+                    break
+
+                batch = pending[start:start + batch_size]
+                results = parallel(
+                    delayed(_evaluate)(self.pipe, candidates[i], X, y, self.cv)
+                    for i in batch)
+
+                for i, result in zip(batch, results):
+                    self._record(candidates[i], resource, result)
+
+                    if result['error'] is None:
+                        scores[i] = result['score']
+                    else:
+                        self.logger.info(
+                            f'Dropping {candidates[i]}: {result["error"]}')
+
+        return scores
+
+    def _record(self, params, resource, result):
+        entry = {'params': params, 'resource': resource, 'data': self._data,
+                 **result}
+
+        self._results[self._key(params, resource, self._data)] = entry
+        self.cv_results_.append(entry)
+
+        if self.log_path:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def _read_log(self):
+        if not self.log_path or not self.log_path.exists():
+            return {}
+
+        results = {}
+
+        with open(self.log_path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    key = self._key(entry['params'], entry['resource'],
+                                    entry.get('data'))
+                    results[key] = entry
+
+        self.logger.info(
+            f'Resuming search with {len(results)} results from '
+            f'{self.log_path}')
+
+        return results
+
+    @staticmethod
+    def _key(params, resource, data):
+        return json.dumps(params, sort_keys=True), resource, data
+
+    def _workers(self):
+        return effective_n_jobs(self.n_jobs)
+
+    def _out_of_time(self):
+        return self.time_budget is not None and \
+            time.perf_counter() - self._started > self.time_budget
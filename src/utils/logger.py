@@ -1,43 +1,251 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
+import threading
+import time
+
+from . import profiling
+
+
+LOG_FORMAT = '%(asctime)s,%(msecs)d %(name)s %(levelname)s - %(message)s'
+
+LOG_DATE_FORMAT = '%H:%M:%S'
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues the record as it is, the message is formatted on the listener
+    thread instead of the thread logging it."""
+
+    def prepare(self, record):
+        return record
+
+
+class _Backend:
+    """
+    The handlers shared by every `Logger` of the process.
+
+    Loggers only put their records on a queue, a background thread writes
+    them to the log file & stdout. The handlers are set up once, so making
+    many `Logger`s doesn't add handlers or duplicate the lines.
+
+    Forked processes (e.g the training pool) write their records directly,
+    they may exit without running atexit & the queue wouldn't be emptied.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.queue_handler = None
+        self.listener = None
+        self.handlers = []
+        self.std_out = False
+        self.direct = False
+
+        atexit.register(self.stop)
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def setup(self, log_file, std_out):
+        with self.lock:
+            if self.handlers and (self.std_out or not std_out):
+                return
+
+            root = logging.getLogger()
+            new_handlers = []
+
+            if not self.handlers:
+                # like logging.basicConfig, the first log file is used
+                new_handlers.append(logging.FileHandler(log_file, mode='a'))
+
+            if std_out:
+                new_handlers.append(logging.StreamHandler(sys.stdout))
+                self.std_out = True
+
+            for handler in new_handlers:
+                handler.setFormatter(
+                    logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+                if self.direct:
+                    root.addHandler(handler)
+
+            self.handlers.extend(new_handlers)
+
+            if self.direct:
+                return
+
+            if self.queue_handler is None:
+                self.queue_handler = _DeferredQueueHandler(self.queue)
+
+                root.addHandler(self.queue_handler)
+                root.setLevel(os.environ.get('LOG_LEVEL', 'DEBUG'))
+
+            self._restart()
+
+    def flush(self):
+        """Waits until the queued records are written."""
+        if self.listener:
+            self.queue.join()
+
+    def stop(self):
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+
+    def _restart(self):
+        self.stop()
+        self.listener = logging.handlers.QueueListener(
+            self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def _after_fork(self):
+        # the listener thread isn't copied into a forked process
+        self.lock = threading.Lock()
+        self.listener = None
+        self.direct = True
+
+        if self.queue_handler:
+            root = logging.getLogger()
+            root.removeHandler(self.queue_handler)
+
+            for handler in self.handlers:
+                root.addHandler(handler)
+
+
+_backend = _Backend()
+
+
+# sampling & rate limits of each module, shared by all its Loggers
+_limits = {}
+
+
+class SamplingFilter:
+    """Keeps a random `rate` share of the messages."""
+
+    def __init__(self, rate):
+        self.rate = rate
+
+        # sampled out messages are not reported
+        self.dropped = 0
+
+    def allow(self):
+        return random.random() < self.rate
+
+
+class RateLimitFilter:
+    """
+    Lets at most `per_second` messages through each second, the number of
+    messages dropped meanwhile is added to the next one.
+    """
+
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.tokens = per_second
+        self.last = time.monotonic()
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.per_second, self.tokens +
+                              (now - self.last) * self.per_second)
+            self.last = now
+
+            if self.tokens < 1:
+                self.dropped += 1
+                return False
+
+            self.tokens -= 1
+
+        return True
+
 
 class Logger():
     """
     A custom class to handle all the logging needs.
 
+    Messages are written by a background thread, so logging costs the
+    caller little more than putting the record on a queue. Pass the values
+    of a message as args, e.g `logger.info('Saved %s rows', n)`, they are
+    only formatted if the level is enabled & the record is kept.
+
     Params:
     name (str): name for the logger,you should pass __name__ generally.
     std_out (bool): Logs the message to the stdout (console) also if set True.
     log_file (str): custom log file to log all the messages, defaults to debug.log
+    sample (float): share of the info & debug messages of this module to keep.
+    rate_limit (float): most info & debug messages of this module per second.
+    Warnings & errors are always kept.
     """
 
     DEFAULT_LOG_FILE = 'debug.log'
 
-    def __init__(self, name, std_out=False ,log_file=None):
+    def __init__(self, name, std_out=False, log_file=None, sample=None,
+                 rate_limit=None):
 
         self.log_file = self.DEFAULT_LOG_FILE if log_file is None else log_file
 
-        logging.basicConfig(
-            level=logging.DEBUG,
-            filemode='a',
-            format='%(asctime)s,%(msecs)d %(name)s %(levelname)s - %(message)s',
-            datefmt='%H:%M:%S',
-            filename=self.log_file,
-        )
-
-        if std_out:
-            logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
+        _backend.setup(self.log_file, std_out)
 
         self._logger = logging.getLogger(name)
+        self._limits = _limits.setdefault(name, {})
+
+        if sample is not None:
+            self._limits['sample'] = SamplingFilter(sample)
+
+        if rate_limit is not None:
+            self._limits['rate_limit'] = RateLimitFilter(rate_limit)
+
+    @staticmethod
+    def flush():
+        """Waits for the background thread to write the queued messages."""
+        _backend.flush()
+
+    def info(self, msg: str, *args):
+        self._log(logging.INFO, msg, args)
+
+    def debug(self, msg: str, *args):
+        self._log(logging.DEBUG, msg, args)
+
+    def error(self, msg: str, *args):
+        self._log(logging.ERROR, msg, args)
+
+    def warning(self, msg: str, *args):
+        self._log(logging.WARNING, msg, args)
+
+    def event(self, name: str, **fields):
+        """Logs a structured event, also sent to the profiling sink if
+        profiling is on, see `src.utils.profiling`."""
+        self._logger.info('%s %s', name, json.dumps(fields, default=str))
+        profiling.emit({'type': 'event', 'name': name,
+                        'logger': self._logger.name, **fields})
+
+    def _log(self, level, msg, args):
+        if not self._logger.isEnabledFor(level):
+            return
+
+        # checked before the record is made, dropping a message is cheap
+        if self._limits and level < logging.WARNING:
+            # every filter sees every message, so a sampled out message
+            # still uses up a rate limit token & the rate stays bounded
+            allowed = [limit.allow() for limit in self._limits.values()]
+
+            if not all(allowed):
+                return
 
-    def info(self, msg: str):
-        self._logger.info(msg)
+            dropped = 0
 
-    def debug(self, msg: str):
-        self._logger.debug(msg)
+            for limit in self._limits.values():
+                dropped += limit.dropped
+                limit.dropped = 0
 
-    def error(self, msg: str):
-        self._logger.error(msg)
+            if dropped:
+                msg = f'{msg} ({dropped} messages dropped)'
 
-    def warning(self, msg: str):
-        self._logger.warning(msg)
\ No newline at end of file
+        self._logger.log(level, msg, *args)
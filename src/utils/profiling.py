@@ -0,0 +1,268 @@
+"""
+Stage level instrumentation of the pipeline.
+
+A stage is timed with the `stage` context manager or the `profiled`
+decorator, which emit one JSON line per run of the stage to the sink set
+by `enable` (or the `PROFILE_EVENTS` environment variable),
+
+    {"type": "stage", "name": "Preprocessor._clean_price",
+     "stack": ["train_model", "Preprocessor.clean",
+               "Preprocessor._clean_price"],
+     "seconds": 0.012, "rows": 38486, "peak_mb": 1.2, "pid": 42, ...}
+
+Nothing is recorded until a sink is set, so the hooks cost a function call
+when profiling is off. The events of a run are aggregated per stage with
+
+> python -m src.utils.profiling reports/profile.jsonl
+> python -m src.utils.profiling reports/profile.jsonl --collapsed > stacks.txt
+
+the second writes collapsed stacks, the input of flamegraph.pl & speedscope.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import click
+
+
+_sink = {'path': os.environ.get('PROFILE_EVENTS') or None,
+         'memory': bool(os.environ.get('PROFILE_MEMORY'))}
+
+_local = threading.local()
+
+_write_lock = threading.Lock()
+
+
+def enable(path, memory=False):
+    """
+    Starts sending the events to a JSON lines file, appended to if it exists.
+
+    Params:
+    path (str): events file.
+    memory (bool): trace the peak memory of each stage, slows down python code.
+    """
+    _sink['path'] = str(path)
+    _sink['memory'] = memory
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    _sink['path'] = None
+
+    if _sink['memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    _sink['memory'] = False
+
+
+def enabled():
+    return _sink['path'] is not None
+
+
+def emit(event):
+    """Appends an event to the sink, if there's one."""
+    if not enabled():
+        return
+
+    line = json.dumps({'time': time.time(), 'pid': os.getpid(), **event},
+                      default=str)
+
+    # opened per event, so processes forked while profiling can append too
+    with _write_lock, open(_sink['path'], 'a') as f:
+        f.write(line + '\n')
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+
+    return _local.stack
+
+
+def _rows(obj):
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Times the block as the stage `name`, nested stages are recorded with the
+    stages they run in. Set `rows` of the yielded event to record the rows
+    the stage handled when they are known only at the end.
+    """
+    if not enabled():
+        yield {}
+        return
+
+    stack = _stack()
+    memory = _sink['memory'] and tracemalloc.is_tracing()
+
+    frame = {'name': name, 'peak': 0}
+
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+
+        # keep the peak of the enclosing stage before it's reset
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+
+        tracemalloc.reset_peak()
+        frame['start'] = current
+
+    stack.append(frame)
+    event = {'type': 'stage', 'name': name,
+             'stack': [f['name'] for f in stack], 'rows': rows}
+
+    start = time.perf_counter()
+
+    try:
+        yield event
+    finally:
+        event['seconds'] = time.perf_counter() - start
+        stack.pop()
+
+        if memory:
+            frame['peak'] = max(frame['peak'],
+                                tracemalloc.get_traced_memory()[1])
+            event['peak_mb'] = (frame['peak'] - frame['start']) / 1024 ** 2
+
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+
+        emit(event)
+
+
+def profiled(name=None, rows=None):
+    """
+    Decorator running the function as a `stage`, named after its qualified
+    name by default.
+
+    Params:
+    name (str): stage name.
+    rows (str): attribute of the instance (first argument) whose length is
+    recorded as the rows of the stage, e.g 'df'. By default the length of
+    the returned value is recorded if it has one.
+    """
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+
+            with stage(stage_name) as event:
+                result = func(*args, **kwargs)
+
+                event['rows'] = _rows(getattr(args[0], rows, None)) \
+                    if rows else _rows(result)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def read_events(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(events):
+    """
+    Aggregates the stage events per stack, the self time of a stage is its
+    time minus the time of the stages it ran.
+    """
+    stats = defaultdict(lambda: {'calls': 0, 'seconds': 0.0,
+                                 'child_seconds': 0.0, 'rows': 0,
+                                 'peak_mb': None})
+
+    for event in events:
+        if event.get('type') != 'stage':
+            continue
+
+        stack = tuple(event['stack'])
+        stat = stats[stack]
+
+        stat['calls'] += 1
+        stat['seconds'] += event['seconds']
+        stat['rows'] += event.get('rows') or 0
+
+        if event.get('peak_mb') is not None:
+            stat['peak_mb'] = max(stat['peak_mb'] or 0, event['peak_mb'])
+
+        if len(stack) > 1:
+            stats[stack[:-1]]['child_seconds'] += event['seconds']
+
+    return {stack: {**stat,
+                    'self_seconds': max(
+                        stat['seconds'] - stat['child_seconds'], 0)}
+            for stack, stat in stats.items()}
+
+
+def report(summary):
+    """Stages as an indented tree, the slowest first at every level."""
+    total = sum(stat['seconds'] for stack, stat in summary.items()
+                if len(stack) == 1) or 1
+
+    def children(parent):
+        found = [stack for stack in summary
+                 if len(stack) == len(parent) + 1 and stack[:-1] == parent]
+        return sorted(found, key=lambda s: summary[s]['seconds'], reverse=True)
+
+    lines = [f"{'stage':<60} {'calls':>6} {'total (s)':>10} {'self (s)':>9} "
+             f"{'%':>6} {'rows/s':>12} {'peak (MB)':>10}"]
+
+    def walk(parent):
+        for stack in children(parent):
+            stat = summary[stack]
+            label = '  ' * (len(stack) - 1) + stack[-1]
+            rate = f"{stat['rows'] / stat['seconds']:.0f}" \
+                if stat['rows'] and stat['seconds'] else ''
+            peak = f"{stat['peak_mb']:.1f}" \
+                if stat['peak_mb'] is not None else ''
+
+            lines.append(
+                f"{label[:60]:<60} {stat['calls']:>6} "
+                f"{stat['seconds']:>10.3f} {stat['self_seconds']:>9.3f} "
+                f"{100 * stat['seconds'] / total:>5.1f}% "
+                f"{rate:>12} {peak:>10}")
+
+            walk(stack)
+
+    walk(())
+
+    return '\n'.join(lines)
+
+
+def collapsed(summary):
+    """Collapsed stacks with their self time in microseconds."""
+    return '\n'.join(f"{';'.join(stack)} {stat['self_seconds'] * 1e6:.0f}"
+                     for stack, stat in summary.items())
+
+
+@click.command()
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--collapsed', 'as_collapsed', is_flag=True,
+              help='Print collapsed stacks for flame graph tools.')
+def main(path, as_collapsed):
+    """Per stage report of the events in PATH."""
+    summary = summarize(read_events(Path(path)))
+
+    click.echo(collapsed(summary) if as_collapsed else report(summary))
+
+
+if __name__ == '__main__':
+    main()
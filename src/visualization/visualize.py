@@ -1,23 +1,17 @@
 
 from pathlib import Path
-import pandas as pd
 import matplotlib.pyplot as plt
 from ..utils.logger import Logger
+from ..data.storage import DatasetStore
 import seaborn as sns
 
 logger = Logger(__name__,__name__ == '__main__')
 
 REPORTS_PATH = Path('visualizations')
 
-def _get_df():
-    path = Path('data/processed/processed.csv')
-
-    if not path.exists():
-        err = f"File does not exist {str(path)}"
-        logger.error(err)
-        raise FileNotFoundError(err)
-
-    return pd.read_csv(str(path))
+def _get_df(columns=None):
+    """Loads the cleaned dataset, pass `columns` to read only those columns."""
+    return DatasetStore().load('data', columns=columns)
 
 def pairplot():
     df = _get_df()
@@ -45,7 +39,7 @@ def plot_heatmap():
 
 
 def owner_coutplot():
-    df = _get_df()
+    df = _get_df(['owner'])
     plt.figure(figsize=(12,8))
     plt.title("Owners Countplot")
     cplot = sns.countplot(x='owner',data=df)
@@ -53,15 +47,7 @@ def owner_coutplot():
     cplot.get_figure().savefig(str(REPORTS_PATH / "onwers_countplot.png"))
 
 def top_cities_plot():
-    
-    path = Path('data/processed/data.csv')
-
-    if not path.exists():
-        err = f"File does not exist {str(path)}"
-        logger.error(err)
-        raise FileNotFoundError(err)
-    
-    df = pd.read_csv(str(path))
+    df = _get_df(['location'])
 
     top = 20
     plt.figure(figsize=(18,8))